@@ -1,6 +1,9 @@
 import os
 import logging
-from flask import Flask, render_template, jsonify, request, send_from_directory
+import mimetypes
+from flask import Flask, render_template, jsonify, request, send_file, abort
+from markupsafe import Markup, escape
+from werkzeug.utils import safe_join
 from .extensions import db, migrate, login_manager, csrf, limiter, cache
 from config import Config
 
@@ -22,15 +25,52 @@ def create_app(config_class=Config):
         logger.warning('⚠️  Using default SECRET_KEY — set SECRET_KEY env var for production!')
 
     # ── Extensions ───────────────────────────────────────
+    # Read-only pool for @read_only GET views (must be configured first)
+    from . import read_pool
+    read_pool.init_app(app)
     db.init_app(app)
-    migrate.init_app(app, db)
+    # PRAGMAs for every new SQLite connection (cache, mmap, busy timeout, ...)
+    from . import sqlite_pragmas
+    sqlite_pragmas.init_app(app)
+    from .services import search
+    migrate.init_app(app, db, include_object=search.include_object)
     login_manager.init_app(app)
     csrf.init_app(app)
     limiter.init_app(app)
-    app.config.setdefault('CACHE_TYPE', 'SimpleCache')
+    # Shared SQLite cache so invalidations reach every gunicorn worker
+    app.config.setdefault('CACHE_TYPE', 'app.cache_backends.SQLiteCache')
     app.config.setdefault('CACHE_DEFAULT_TIMEOUT', 300)
+    app.config.setdefault('CACHE_THRESHOLD', 10000)
     cache.init_app(app)
 
+    # ── Request / SQL timing ─────────────────────────────
+    from . import instrumentation
+    instrumentation.init_app(app)
+
+    # ── On-demand profiler (armed via /api/profile) ──────
+    from . import profiler
+    profiler.init_app(app)
+
+    # ── Metrics (/metrics, aggregated across workers) ────
+    from . import metrics
+    metrics.init_app(app, cache, limiter)
+
+    # ── Upload image conversion pool ──────────────────────
+    from . import image_pool
+    image_pool.init_app(app)
+
+    # ── Live notification events (shared across workers) ─
+    from . import broadcast
+    broadcast.init_app(app)
+
+    # ── Background jobs (outbox drained off-request) ──────
+    from .services import jobs
+    jobs.init_app(app)
+
+    # ── @mention autocomplete index (per worker, in memory) ─
+    from .services import mention_index
+    mention_index.init_app(app)
+
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
     login_manager.login_message_category = 'info'
@@ -73,27 +113,78 @@ def create_app(config_class=Config):
     app.jinja_env.filters['render_mentions'] = render_mentions
 
     # ── Uploads route (serves from UPLOAD_FOLDER, even if outside static/) ──
+    # Upload names are never reused for other content (content hashes, older
+    # ones random), so responses can be cached for good.
     @app.route('/uploads/<path:filename>')
     def uploaded_file(filename):
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+        if path is None:
+            abort(404)
+        if not os.path.isfile(path):
+            if not image_pool.is_pending(filename):
+                abort(404)
+            # Still converting: placeholder the client re-checks (app.js)
+            response = app.response_class(image_pool.PLACEHOLDER_SVG, mimetype='image/svg+xml')
+            response.headers['Cache-Control'] = 'no-store'
+            response.headers['X-Upload-Pending'] = '1'
+            return response
+
+        accel_prefix = app.config['UPLOADS_ACCEL_REDIRECT']
+        if accel_prefix:
+            # Let the fronting nginx send the bytes (internal location on UPLOAD_FOLDER)
+            response = app.response_class(mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + filename
+        else:
+            # send_file hands off to the server itself when USE_X_SENDFILE is set
+            response = send_file(path, etag=False, conditional=False)
+        response.set_etag(filename)
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        response.make_conditional(request)
+        if response.status_code == 304:
+            response.headers.pop('X-Accel-Redirect', None)
+        return response
 
     # ── Template global for upload URLs ───────────────────
+    def _has_variants(filename):
+        return os.path.exists(os.path.join(
+            app.config['UPLOAD_FOLDER'], image_pool.variant_name(filename, image_pool.VARIANT_WIDTHS[0])))
+
     @app.template_global()
-    def upload_url(filename):
-        """Generate URL for an uploaded file. Works with any UPLOAD_FOLDER location."""
-        if filename:
-            from flask import url_for as _url_for
-            return _url_for('uploaded_file', filename=filename)
-        return ''
-
-    # ── Context processor (cached notification counts) ────
+    def upload_url(filename, width=None):
+        """Generate URL for an uploaded file. Works with any UPLOAD_FOLDER location.
+
+        With ``width`` (displayed CSS pixels) the smallest size variant that
+        is sharp on 2x screens is used, if the upload has one."""
+        if not filename:
+            return ''
+        from flask import url_for as _url_for
+        if width:
+            filename = image_pool.sized_name(filename, width, app.config['UPLOAD_FOLDER'])
+        return _url_for('uploaded_file', filename=filename)
+
+    @app.template_global()
+    def upload_srcset(filename, sizes, full_width=800):
+        """``srcset``/``sizes`` attributes listing an upload's size variants."""
+        if not filename or not _has_variants(filename):
+            return ''
+        from flask import url_for as _url_for
+        candidates = [(image_pool.variant_name(filename, w), w)
+                      for w in image_pool.VARIANT_WIDTHS if w < full_width]
+        candidates.append((filename, full_width))
+        srcset = ', '.join(f"{_url_for('uploaded_file', filename=name)} {w}w" for name, w in candidates)
+        return Markup(f'srcset="{escape(srcset)}" sizes="{escape(sizes)}"')
+
+    app.add_template_global(image_pool.is_pending, 'upload_pending')
+    app.add_template_global(broadcast.latest_id, 'notification_event_id')
+
+    # ── Context processor (notification badge counts) ─────
     @app.context_processor
     def inject_notifications():
         from flask_login import current_user as cu
         if cu.is_authenticated:
-            # Unified notification count (likes, comments, reactions, connections)
-            from .services.notifications import get_unread_count
-            notification_count = get_unread_count(cu.id)
+            # Unified notification count (likes, comments, reactions, connections),
+            # maintained on write — already loaded with the user, no query needed
+            notification_count = cu.unread_notification_count or 0
 
             # Group admin join request count (separate, shown on groups nav icon)
             group_cache_key = f'group_notif_count:{cu.id}'
@@ -140,22 +231,31 @@ def create_app(config_class=Config):
 
     @app.errorhandler(429)
     def ratelimit_error(error):
+        metrics.inc('veau_ratelimit_rejections_total',
+                    blueprint=request.blueprint or '', endpoint=request.endpoint or '')
         if request.path.startswith('/api/'):
             return jsonify(error='Too many requests. Please slow down.'), 429
         return render_template('errors/429.html'), 429
 
     # ── CLI commands ────────────────────────────────────────
-    from .cli import seed_achievements
+    from .cli import (seed_achievements, prune_notifications, run_jobs, gc_uploads,
+                      replicate, restore_replica, bench_sqlite)
     app.cli.add_command(seed_achievements)
+    app.cli.add_command(prune_notifications)
+    app.cli.add_command(run_jobs)
+    app.cli.add_command(gc_uploads)
+    app.cli.add_command(replicate)
+    app.cli.add_command(restore_replica)
+    app.cli.add_command(bench_sqlite)
 
     # ── Database init & upload folder ─────────────────────
     with app.app_context():
         db.create_all()
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        # Enable WAL mode for better read/write concurrency
+        # (WAL mode and other PRAGMAs: sqlite_pragmas.py, on every connection)
         if 'sqlite' in app.config['SQLALCHEMY_DATABASE_URI']:
-            db.session.execute(db.text('PRAGMA journal_mode=WAL'))
-            db.session.execute(db.text('PRAGMA synchronous=NORMAL'))
+            # Full-text search indexes (FTS5 + sync triggers)
+            search.ensure_index()
             db.session.commit()
 
         # Auto-seed achievements if table is empty (first deploy)
@@ -1,20 +1,20 @@
 import logging
 import hmac
-import io
-import os
-import shutil
-import sqlite3
-import tarfile
-import tempfile
+import json
 from sqlalchemy.exc import IntegrityError
-from flask import jsonify, request, abort, render_template, current_app, send_file
+from flask import jsonify, request, abort, render_template, current_app
 from flask_login import login_required, current_user
 from . import bp
-from ..extensions import db, limiter, cache
+from ..extensions import db, limiter, cache, csrf
 from ..models import (BeerPost, Like, Comment, Reaction, ALLOWED_REACTIONS,
                       User, Group, Tag, Connection, GroupMember, GroupJoinRequest,
                       CompetitionBeer, CompetitionParticipant, Notification)
-from ..services.notifications import notify
+from ..services.notifications import notify, recount_actors
+from ..services.search import search_users, search_groups, search_tags
+from ..services.mention_index import index as mention_index
+from ..services.cache import get_or_compute
+from ..services import backup as backup_service
+from .. import image_pool, profiler
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +30,7 @@ def toggle_like(id):
     existing = Like.query.filter_by(user_id=current_user.id, post_id=post.id).first()
     if existing:
         db.session.delete(existing)
+        recount_actors(post.user_id, 'like', post.id)
         db.session.commit()
         count = Like.query.filter_by(post_id=post.id).count()
         return jsonify(success=True, liked=False, count=count)
@@ -60,6 +61,7 @@ def toggle_reaction(id):
     ).first()
     if existing:
         db.session.delete(existing)
+        recount_actors(post.user_id, 'reaction', post.id)
         db.session.commit()
         toggled = False
     else:
@@ -145,31 +147,58 @@ def _batch_connection_statuses(user_ids):
     return result
 
 
-def _serialize_users_batch(users):
-    """Serialize a list of users with batch-loaded connection statuses (2 queries instead of 2N)."""
-    if not users:
-        return []
-    statuses = _batch_connection_statuses([u.id for u in users])
+def _with_connection_status(users):
+    """Add the viewer's connection status to serialized users (2 queries total)."""
+    statuses = _batch_connection_statuses([u['id'] for u in users])
+    return [dict(u, connection_status=statuses.get(u['id'])) for u in users]
+
+
+def _avatar(filename, width=44):
+    """Avatar filename to hand to the JS renderers (a small variant if any)."""
+    return image_pool.sized_name(filename, width, current_app.config['UPLOAD_FOLDER'])
+
+
+def _user_dicts(users):
     return [{
         'id': u.id,
         'username': u.username,
         'display_name': u.display_name,
-        'avatar': u.avatar_filename,
-        'connection_status': statuses.get(u.id),
+        'avatar': _avatar(u.avatar_filename),
     } for u in users]
 
 
-def _serialize_groups_batch(groups):
-    """Serialize groups with batch-loaded membership info (2 queries instead of 3N)."""
-    if not groups:
+def _serialize_users_batch(users):
+    """Serialize a list of users with batch-loaded connection statuses (2 queries instead of 2N)."""
+    if not users:
         return []
-    group_ids = [g.id for g in groups]
+    return _with_connection_status(_user_dicts(users))
+
 
-    # Batch: member counts
-    count_rows = db.session.query(
+def _group_dicts(groups):
+    """Viewer-independent group fields, member counts in one query."""
+    if not groups:
+        return []
+    count_map = dict(db.session.query(
         GroupMember.group_id, db.func.count(GroupMember.id)
-    ).filter(GroupMember.group_id.in_(group_ids)).group_by(GroupMember.group_id).all()
-    count_map = dict(count_rows)
+    ).filter(
+        GroupMember.group_id.in_([g.id for g in groups])
+    ).group_by(GroupMember.group_id).all())
+
+    return [{
+        'id': g.id,
+        'name': g.name,
+        'description': g.description or '',
+        'avatar': _avatar(g.avatar_filename),
+        'member_count': count_map.get(g.id, 0),
+        'is_private': g.is_private,
+    } for g in groups]
+
+
+def _with_membership(groups):
+    """Add the viewer's membership and pending-request flags (2 queries total)."""
+    if not groups:
+        return []
+    group_ids = [g['id'] for g in groups]
 
     # Batch: which groups current user is member of
     my_memberships = set(
@@ -188,16 +217,25 @@ def _serialize_groups_batch(groups):
         ).all()
     )
 
-    return [{
-        'id': g.id,
-        'name': g.name,
-        'description': g.description or '',
-        'avatar': g.avatar_filename,
-        'member_count': count_map.get(g.id, 0),
-        'is_member': g.id in my_memberships,
-        'is_private': g.is_private,
-        'has_pending_request': g.id in pending_reqs,
-    } for g in groups]
+    return [dict(g, is_member=g['id'] in my_memberships,
+                 has_pending_request=g['id'] in pending_reqs) for g in groups]
+
+
+def _serialize_groups_batch(groups):
+    """Serialize groups with batch-loaded membership info (3 queries instead of 3N)."""
+    return _with_membership(_group_dicts(groups))
+
+
+SUGGESTIONS_CACHE_KEY = 'search_suggestions'
+SUGGESTIONS_TTL = 30  # seconds
+SUGGESTED_GROUPS_POOL = 100  # cached so enough remain after removing the viewer's groups
+
+
+def _suggestion_pool():
+    """Newest users and first groups, without any per-viewer data."""
+    users = User.query.order_by(User.created_at.desc()).limit(21).all()
+    groups = Group.query.limit(SUGGESTED_GROUPS_POOL).all()
+    return {'users': _user_dicts(users), 'groups': _group_dicts(groups)}
 
 
 @bp.route('/search', methods=['GET'])
@@ -207,39 +245,26 @@ def search():
     q = request.args.get('q', '').strip()
 
     if not q:
-        # Suggestions mode: all other users + all groups
-        suggested_users = User.query.filter(
-            User.id != current_user.id
-        ).order_by(User.created_at.desc()).limit(20).all()
+        # Suggestions mode: the lists are shared (cached across workers),
+        # only connection status and membership are computed per viewer
+        pool = get_or_compute(SUGGESTIONS_CACHE_KEY, _suggestion_pool, SUGGESTIONS_TTL)
+        users = [u for u in pool['users'] if u['id'] != current_user.id][:20]
 
-        my_group_ids = [m.group_id for m in current_user.group_memberships.all()]
-        suggested_groups = Group.query.filter(
-            ~Group.id.in_(my_group_ids) if my_group_ids else db.true(),
-        ).limit(20).all()
+        my_group_ids = {r[0] for r in db.session.query(GroupMember.group_id).filter(
+            GroupMember.user_id == current_user.id)}
+        groups = [g for g in pool['groups'] if g['id'] not in my_group_ids][:20]
 
         return jsonify(
             suggestions=True,
-            users=_serialize_users_batch(suggested_users),
-            groups=_serialize_groups_batch(suggested_groups),
+            users=_with_connection_status(users),
+            groups=_with_membership(groups),
             tags=[],
         )
 
-    # Search mode
-    users = User.query.filter(
-        User.id != current_user.id,
-        db.or_(
-            User.username.ilike(f'%{q}%'),
-            User.display_name.ilike(f'%{q}%'),
-        )
-    ).limit(20).all()
-
-    groups = Group.query.filter(
-        Group.name.ilike(f'%{q}%')
-    ).limit(20).all()
-
-    tags = Tag.query.filter(
-        Tag.name.ilike(f'%{q}%')
-    ).order_by(Tag.use_count.desc()).limit(20).all()
+    # Search mode: FTS5 indexes, see services/search.py
+    users = search_users(q, exclude_id=current_user.id)
+    groups = search_groups(q)
+    tags = search_tags(q)
 
     return jsonify(
         suggestions=False,
@@ -249,6 +274,25 @@ def search():
     )
 
 
+@bp.route('/mentions/complete', methods=['GET'])
+@login_required
+@limiter.limit("120 per minute")
+def mention_complete():
+    """@mention autocomplete from the in-memory prefix index (no table scans)."""
+    q = request.args.get('q', '').strip().lstrip('@')
+    if not q:
+        return jsonify(users=[], groups=[], tags=[])
+
+    mention_index.sync()
+    found = mention_index.complete(q, current_user.id)
+    return jsonify(
+        users=[{'username': e['username'], 'display_name': e['display_name'],
+                'avatar': _avatar(e['avatar'], 32)} for e in found['user']],
+        groups=[{'name': e['name'], 'member_count': e['member_count']} for e in found['group']],
+        tags=[{'name': e['name']} for e in found['tag']],
+    )
+
+
 # ── Connect (AJAX) ────────────────────────────────────────
 
 @bp.route('/connect/<username>', methods=['POST'])
@@ -319,10 +363,10 @@ def api_join_group(id):
     db.session.add(req)
     try:
         db.session.commit()
-        # Invalidate notification cache for group admins
+        # Invalidate join-request badge cache for group admins
         admins = GroupMember.query.filter_by(group_id=group.id, role='admin').all()
         for a in admins:
-            cache.delete(f'notif_count:{a.user_id}')
+            cache.delete(f'group_notif_count:{a.user_id}')
     except IntegrityError:
         db.session.rollback()
         return jsonify(success=True, status='requested')
@@ -459,12 +503,10 @@ def verify_competition_beer(beer_id):
 
 # ── Backup endpoint ──────────────────────────────────────
 
-@bp.route('/backup', methods=['GET'])
-@limiter.limit("1 per minute")
-def backup():
-    """Download a .tar.gz backup of the database and uploads.
-    Protected by BACKUP_SECRET env var. Disabled when secret is empty."""
-    secret = current_app.config.get('BACKUP_SECRET', '')
+def _require_secret(config_key):
+    """Abort unless ?secret= matches the given config value.
+    404 when the secret is not configured (feature disabled), 403 on mismatch."""
+    secret = current_app.config.get(config_key, '')
     if not secret:
         abort(404)
 
@@ -472,37 +514,94 @@ def backup():
     if not hmac.compare_digest(secret, provided):
         abort(403)
 
+
+@bp.route('/backup', methods=['GET'])
+@limiter.limit("1 per minute")
+def backup():
+    """Download a .tar.gz backup of the database and uploads.
+    Protected by BACKUP_SECRET env var. Disabled when secret is empty.
+
+    ?since=<epoch seconds> makes it incremental: only uploads changed since
+    then (pass the created_at of the previous backup's backup.json). The
+    archive is streamed while it is being built (see services/backup.py)."""
+    _require_secret('BACKUP_SECRET')
+
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = float(since)
+        except ValueError:
+            abort(400)
+
     db_uri = current_app.config['SQLALCHEMY_DATABASE_URI']
     db_path = db_uri.replace('sqlite:///', '')
     upload_folder = current_app.config['UPLOAD_FOLDER']
 
-    tmp_dir = tempfile.mkdtemp()
-    try:
-        # Use SQLite backup API for a consistent snapshot
-        backup_db_path = os.path.join(tmp_dir, 'bierstrava.db')
-        src = sqlite3.connect(db_path)
-        dst = sqlite3.connect(backup_db_path)
-        src.backup(dst)
-        src.close()
-        dst.close()
-
-        # Create tar.gz in memory
-        buf = io.BytesIO()
-        with tarfile.open(fileobj=buf, mode='w:gz') as tar:
-            tar.add(backup_db_path, arcname='bierstrava.db')
-            if os.path.isdir(upload_folder):
-                for fname in os.listdir(upload_folder):
-                    fpath = os.path.join(upload_folder, fname)
-                    if os.path.isfile(fpath):
-                        tar.add(fpath, arcname=f'uploads/{fname}')
-
-        buf.seek(0)
-        logger.info('Backup created successfully')
-        return send_file(
-            buf,
-            mimetype='application/gzip',
-            as_attachment=True,
-            download_name='veau-backup.tar.gz',
-        )
-    finally:
-        shutil.rmtree(tmp_dir, ignore_errors=True)
+    logger.info('Backup started (%s)', 'full' if since is None else f'since {since:.0f}')
+    return current_app.response_class(
+        backup_service.stream_archive(db_path, upload_folder, current_app.config['RUNTIME_DIR'], since),
+        mimetype='application/gzip',
+        headers={'Content-Disposition': 'attachment; filename=veau-backup.tar.gz',
+                 'Cache-Control': 'no-store'},
+    )
+
+
+@bp.route('/backup/manifest', methods=['GET'])
+@limiter.limit("1 per minute")
+def backup_manifest():
+    """The current upload manifest as JSON lines: [path, size, sha256].
+    Protected by BACKUP_SECRET env var."""
+    _require_secret('BACKUP_SECRET')
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    runtime_dir = current_app.config['RUNTIME_DIR']
+
+    def generate():
+        for _, rel, stat, sha256 in backup_service.iter_manifest(upload_folder, runtime_dir):
+            yield json.dumps([rel, stat.st_size, sha256]) + '\n'
+
+    return current_app.response_class(generate(), mimetype='application/x-ndjson',
+                                      headers={'Cache-Control': 'no-store'})
+
+
+# ── Profiler endpoint ────────────────────────────────────
+
+@bp.route('/profile', methods=['POST'])
+@csrf.exempt
+@limiter.limit("10 per minute")
+def arm_profiler():
+    """Profile the next N requests to an endpoint across all workers.
+    Protected by PROFILER_SECRET env var. Disabled when secret is empty.
+
+    Usage: POST /api/profile?secret=...&endpoint=main.feed&requests=20
+    """
+    _require_secret('PROFILER_SECRET')
+
+    endpoint = request.args.get('endpoint', '').strip()
+    if endpoint not in current_app.view_functions:
+        return jsonify(success=False, error=f'Unknown endpoint: {endpoint}'), 400
+    count = max(1, min(request.args.get('requests', 10, type=int), 500))
+    interval_ms = max(1, min(request.args.get('interval_ms', 5, type=int), 100))
+
+    profiler.arm(current_app, endpoint, count, interval_ms / 1000)
+    logger.info('Profiler armed for %s (%d requests)', endpoint, count)
+    return jsonify(success=True, endpoint=endpoint, requests=count, interval_ms=interval_ms)
+
+
+@bp.route('/profile', methods=['GET'])
+@limiter.limit("10 per minute")
+def download_profile():
+    """Download the aggregated collapsed-stack profile (flamegraph.pl / speedscope).
+    Protected by PROFILER_SECRET env var. Disabled when secret is empty."""
+    _require_secret('PROFILER_SECRET')
+
+    state = profiler.status(current_app) or {}
+    body = profiler.collapsed_stacks(current_app)
+    return current_app.response_class(
+        body,
+        mimetype='text/plain',
+        headers={
+            'Content-Disposition': 'attachment; filename=veau-profile.folded',
+            'X-Profile-Endpoint': state.get('endpoint', ''),
+            'X-Profile-Remaining': str(state.get('remaining', 0)),
+        },
+    )
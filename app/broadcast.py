@@ -0,0 +1,87 @@
+"""Cross-worker event broadcaster for live notification updates.
+
+Events are appended to a small WAL-mode SQLite file under ``RUNTIME_DIR``;
+every worker's SSE streams poll it by ``(user_id, id)``, which costs one
+indexed lookup per stream per second. Publishing from request code goes
+through ``publish_after_commit`` so a rolled-back transaction never leaks an
+event. Events are only kept for ``EVENT_TTL`` seconds: enough for clients to
+catch up via ``Last-Event-ID`` after a reconnect.
+"""
+
+import json
+import os
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .local_sqlite import LocalSQLite
+
+EVENT_TTL = 600  # seconds an event stays available for reconnecting clients
+PRUNE_EVERY = 200  # publishes between cleanups (per process)
+
+_db = None
+_published = 0
+
+
+def publish(user_id, name, data):
+    """Append an event for one user. Visible to all workers immediately."""
+    global _published
+    if _db is None:
+        return
+    now = time.time()
+    conn = _db.conn()
+    conn.execute(
+        'INSERT INTO events (user_id, name, data, created_at) VALUES (?, ?, ?, ?)',
+        (user_id, name, json.dumps(data), now),
+    )
+    _published += 1
+    if _published % PRUNE_EVERY == 0:
+        conn.execute('DELETE FROM events WHERE created_at < ?', (now - EVENT_TTL,))
+
+
+def publish_after_commit(session, user_id, name, data):
+    """Queue an event that is published once ``session`` commits."""
+    session.info.setdefault('broadcast', []).append((user_id, name, data))
+
+
+def latest_id():
+    """Id of the newest event, used as the starting point of a new stream."""
+    row = _db.conn().execute('SELECT MAX(id) FROM events').fetchone()
+    return row[0] or 0
+
+
+def oldest_id():
+    """Id of the oldest event still kept (the next id when all were pruned)."""
+    row = _db.conn().execute(
+        "SELECT COALESCE(MIN(id), (SELECT seq + 1 FROM sqlite_sequence WHERE name = 'events'))"
+        " FROM events").fetchone()
+    return row[0] or 0
+
+
+def poll(user_id, after_id):
+    """Events for ``user_id`` newer than ``after_id`` as (id, name, data) tuples."""
+    rows = _db.conn().execute(
+        'SELECT id, name, data FROM events WHERE user_id = ? AND id > ? ORDER BY id',
+        (user_id, after_id),
+    ).fetchall()
+    return [(event_id, name, json.loads(data)) for event_id, name, data in rows]
+
+
+@event.listens_for(Session, 'after_commit')
+def _flush_pending(session):
+    for user_id, name, data in session.info.pop('broadcast', ()):
+        publish(user_id, name, data)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _drop_pending(session, previous_transaction):
+    session.info.pop('broadcast', None)
+
+
+def init_app(app):
+    global _db
+    _db = LocalSQLite(os.path.join(app.config['RUNTIME_DIR'], 'events.sqlite'), schema=(
+        'CREATE TABLE IF NOT EXISTS events ('
+        ' id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,'
+        ' name TEXT NOT NULL, data TEXT NOT NULL, created_at REAL NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS idx_events_user ON events (user_id, id)',
+    ))
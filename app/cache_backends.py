@@ -0,0 +1,117 @@
+"""SQLite-backed Flask-Caching backend shared by all gunicorn workers.
+
+Every worker and thread reads and writes the same file under ``RUNTIME_DIR``,
+so ``cache.delete(...)`` in one worker is immediately visible to the others.
+Entries carry an absolute expiry and an access timestamp; once the table
+exceeds ``CACHE_THRESHOLD`` rows the least recently used entries are evicted.
+
+Use with ``CACHE_TYPE = 'app.cache_backends.SQLiteCache'``.
+"""
+
+import os
+import pickle
+import time
+from flask_caching.backends.base import BaseCache
+from .local_sqlite import LocalSQLite
+
+ACCESS_RESOLUTION = 1.0  # seconds; limits access-time writes on hot keys
+PRUNE_EVERY = 100  # sets between eviction passes (per process)
+
+
+class SQLiteCache(BaseCache):
+    """Cross-process cache with TTLs and approximate LRU eviction."""
+
+    def __init__(self, path, default_timeout=300, threshold=10000):
+        super().__init__(default_timeout=default_timeout)
+        self.path = path
+        self.threshold = threshold
+        self._sets = 0
+        self._db = LocalSQLite(path, schema=(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            ' key TEXT PRIMARY KEY, value BLOB NOT NULL,'
+            ' expires_at REAL, accessed_at REAL NOT NULL'
+            ') WITHOUT ROWID',
+            'CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)',
+        ))
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        path = config.get('CACHE_SQLITE_PATH') or os.path.join(
+            app.config['RUNTIME_DIR'], 'cache.sqlite')
+        kwargs.update(threshold=config['CACHE_THRESHOLD'])
+        return cls(path, *args, **kwargs)
+
+    def _conn(self):
+        return self._db.conn()
+
+    def _expiry(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout > 0 else None
+
+    def get(self, key):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT value, expires_at, accessed_at FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at, accessed_at = row
+        if expires_at is not None and expires_at <= now:
+            conn.execute('DELETE FROM cache WHERE key = ? AND expires_at <= ?', (key, now))
+            return None
+        if accessed_at < now - ACCESS_RESOLUTION:
+            conn.execute('UPDATE cache SET accessed_at = ? WHERE key = ?', (now, key))
+        try:
+            return pickle.loads(value)
+        except (pickle.PickleError, EOFError, AttributeError, ImportError):
+            return None
+
+    def set(self, key, value, timeout=None):
+        now = time.time()
+        self._conn().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expiry(timeout), now),
+        )
+        self._maybe_prune(now)
+        return True
+
+    def add(self, key, value, timeout=None):
+        now = time.time()
+        cur = self._conn().execute(
+            'INSERT INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, '
+            'expires_at = excluded.expires_at, accessed_at = excluded.accessed_at '
+            'WHERE cache.expires_at IS NOT NULL AND cache.expires_at <= ?',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expiry(timeout), now, now),
+        )
+        self._maybe_prune(now)
+        return cur.rowcount > 0
+
+    def delete(self, key):
+        cur = self._conn().execute('DELETE FROM cache WHERE key = ?', (key,))
+        return cur.rowcount > 0
+
+    def has(self, key):
+        row = self._conn().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def clear(self):
+        self._conn().execute('DELETE FROM cache')
+        return True
+
+    def _maybe_prune(self, now):
+        self._sets += 1
+        if self._sets % PRUNE_EVERY:
+            return
+        conn = self._conn()
+        conn.execute('DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?', (now,))
+        overflow = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.threshold
+        if overflow > 0:
+            conn.execute(
+                'DELETE FROM cache WHERE key IN '
+                '(SELECT key FROM cache ORDER BY accessed_at LIMIT ?)', (overflow,)
+            )
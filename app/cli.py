@@ -78,3 +78,343 @@ def seed_achievements():
     """Seed or update all achievements."""
     seed_achievements_data()
     click.echo('Achievements seeded successfully.')
+
+
+@click.command('prune-notifications')
+@click.option('--days', type=int, default=None,
+              help='Delete read notifications older than this (default: NOTIFICATION_RETENTION_DAYS).')
+@click.option('--batch-size', type=int, default=500, show_default=True,
+              help='Rows deleted per transaction.')
+@click.option('--archive', type=click.Path(dir_okay=False), default=None,
+              help='Append pruned rows to this CSV file before deleting them.')
+@with_appcontext
+def prune_notifications(days, batch_size, archive):
+    """Delete read notifications older than the retention period, in small batches.
+
+    A notification is read when its id is at or below the recipient's
+    last_read_notification_id. Each batch is its own short transaction so the
+    SQLite write lock is never held for long.
+    """
+    import csv
+    import time
+    from datetime import datetime, timedelta
+    from flask import current_app
+    from .models import Notification, User
+
+    if days is None:
+        days = current_app.config['NOTIFICATION_RETENTION_DAYS']
+    cutoff = datetime.utcnow() - timedelta(days=days)
+
+    archive_file = open(archive, 'a', newline='') if archive else None
+    writer = csv.writer(archive_file) if archive_file else None
+    total = 0
+    try:
+        while True:
+            rows = db.session.query(
+                Notification.id, Notification.user_id, Notification.actor_id,
+                Notification.type, Notification.post_id, Notification.actor_count,
+                Notification.created_at,
+            ).join(User, User.id == Notification.user_id).filter(
+                Notification.created_at < cutoff,
+                Notification.id <= User.last_read_notification_id,
+            ).limit(batch_size).all()
+            if not rows:
+                break
+
+            if writer:
+                writer.writerows(rows)
+                archive_file.flush()
+            Notification.query.filter(
+                Notification.id.in_([r.id for r in rows])
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            total += len(rows)
+
+            if len(rows) < batch_size:
+                break
+            time.sleep(0.05)  # let queued writers in between batches
+    finally:
+        if archive_file:
+            archive_file.close()
+
+    click.echo(f'Pruned {total} notification(s) older than {days} days.')
+
+
+@click.command('run-jobs')
+@click.option('--once', is_flag=True, help='Drain the queue once and exit.')
+@with_appcontext
+def run_jobs(once):
+    """Run background jobs from the outbox (see app/services/jobs.py).
+
+    The web workers already run one job thread each (JOB_WORKER_THREAD);
+    this is for draining the queue by hand, on the machine that holds the
+    database. Without --once it polls forever; several runners can safely
+    share the queue.
+    """
+    import time
+    from .services import jobs
+
+    if once:
+        click.echo(f'Ran {jobs.run_pending()} job(s).')
+        return
+    click.echo('Running jobs (Ctrl+C to stop)...')
+    while True:
+        try:
+            ran = jobs.run_pending(limit=50)
+        except Exception as exc:
+            db.session.rollback()
+            click.echo(f'Job runner error: {exc!r}', err=True)
+            ran = 0
+        if not ran:
+            time.sleep(jobs.IDLE_SLEEP)
+
+
+@click.command('gc-uploads')
+@click.option('--grace-hours', type=float, default=24, show_default=True,
+              help='Keep unreferenced files modified more recently than this.')
+@click.option('--quarantine', type=click.Path(file_okay=False), default=None,
+              help='Move unreferenced files here (same layout) instead of deleting them.')
+@click.option('--dry-run', is_flag=True, help='Only report what would be removed.')
+@with_appcontext
+def gc_uploads(grace_hours, quarantine, dry_run):
+    """Remove upload files that no user, group or post refers to.
+
+    Referenced names are streamed from the database into a set; the upload
+    tree is walked with os.scandir, one directory at a time, so neither the
+    query result nor the directory listing is held in memory. Size variants
+    (<name>-<w>w.webp) live and die with their upload. The grace period
+    covers uploads whose post is still being saved.
+    """
+    import os
+    import shutil
+    import time
+    from flask import current_app
+    from . import image_pool
+    from .models import BeerPost, Group, Upload, User
+
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    cutoff = time.time() - grace_hours * 3600
+
+    referenced = set()
+    for column in (User.avatar_filename, Group.avatar_filename, BeerPost.photo_filename):
+        rows = db.session.execute(
+            db.select(column).where(column.isnot(None)).execution_options(yield_per=5000))
+        referenced.update(name for (name,) in rows)
+    rows = db.session.execute(
+        db.select(Upload.filename).where(Upload.refcount > 0).execution_options(yield_per=5000))
+    referenced.update(name for (name,) in rows)
+    db.session.commit()
+    click.echo(f'{len(referenced)} referenced upload(s).')
+
+    skip_dir = os.path.abspath(quarantine) if quarantine else None
+
+    def walk(directory):
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if os.path.abspath(entry.path) != skip_dir:
+                        yield from walk(entry.path)
+                elif entry.is_file(follow_symlinks=False) and not entry.name.startswith('.'):
+                    yield entry  # (dotfiles like .gitkeep aren't uploads)
+
+    removed = reclaimed = 0
+    forgotten = []
+    for entry in walk(upload_folder):
+        name = os.path.relpath(entry.path, upload_folder).replace(os.sep, '/')
+        base = image_pool.base_name(name[:-len('.tmp')] if name.endswith('.tmp') else name)
+        if base in referenced:
+            continue
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_mtime > cutoff:
+            continue
+        removed += 1
+        reclaimed += stat.st_size
+        if dry_run:
+            continue
+        if quarantine:
+            target = os.path.join(quarantine, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(entry.path, target)
+        else:
+            os.remove(entry.path)
+        if base == name:
+            forgotten.append(name)
+        if len(forgotten) >= 500:
+            Upload.query.filter(Upload.filename.in_(forgotten), Upload.refcount == 0).delete(
+                synchronize_session=False)
+            db.session.commit()
+            forgotten = []
+    if forgotten:
+        Upload.query.filter(Upload.filename.in_(forgotten), Upload.refcount == 0).delete(
+            synchronize_session=False)
+        db.session.commit()
+
+    action = 'Would remove' if dry_run else ('Quarantined' if quarantine else 'Removed')
+    click.echo(f'{action} {removed} file(s), {reclaimed / 1024 / 1024:.1f} MB.')
+
+
+@click.command('replicate')
+@click.option('--once', is_flag=True, help='Start a generation, ship once and exit.')
+@with_appcontext
+def replicate(once):
+    """Ship committed WAL frames to REPLICA_DIR (see app/replication.py).
+
+    Meant as a separate process next to the web workers, on the same
+    machine as the database. It owns WAL checkpoints while REPLICA_DIR is
+    set, so keep exactly one running.
+    """
+    import time
+    from flask import current_app
+    from . import metrics, replication
+
+    config = current_app.config
+    if not config['REPLICA_DIR']:
+        raise click.ClickException('REPLICA_DIR is not set.')
+    db_path = config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
+    replicator = replication.Replicator(
+        db_path, config['REPLICA_DIR'],
+        checkpoint_pages=config['REPLICA_CHECKPOINT_PAGES'],
+        snapshot_hours=config['REPLICA_SNAPSHOT_HOURS'],
+        retention_hours=config['REPLICA_RETENTION_HOURS'])
+    if once:
+        replicator.step()
+        replicator.report_lag()
+        metrics.flush()
+        click.echo(f'Replicated to generation {replicator.generation}.')
+        return
+    click.echo(f'Replicating {db_path} → {config["REPLICA_DIR"]} (Ctrl+C to stop)...')
+    next_flush = 0.0
+    while True:
+        try:
+            replicator.step()
+        except Exception as exc:
+            click.echo(f'Replication error: {exc!r}', err=True)
+        replicator.report_lag()
+        if time.monotonic() >= next_flush:
+            next_flush = time.monotonic() + metrics.FLUSH_INTERVAL
+            metrics.flush()
+        time.sleep(config['REPLICA_INTERVAL'])
+
+
+@click.command('restore-replica')
+@click.option('--at', 'at', type=click.DateTime(), default=None,
+              help='Point in time (UTC) to restore; default: the latest replicated state.')
+@click.option('--output', type=click.Path(dir_okay=False), default=None,
+              help='Write the database here instead of replacing the live one.')
+@with_appcontext
+def restore_replica(at, output):
+    """Rebuild the database from REPLICA_DIR as of a point in time.
+
+    Takes the newest generation snapshot before --at and replays the shipped
+    transactions up to it. The result must pass integrity_check before it
+    is written to --output or, after confirmation, swapped in for the live
+    database (stop the app and the replicator first). Uploads aren't
+    replicated; they come from the regular backups.
+    """
+    import calendar
+    import os
+    from datetime import datetime
+    from flask import current_app
+    from . import replication
+    from .services import backup as backup_service
+
+    replica_dir = current_app.config['REPLICA_DIR']
+    if not replica_dir:
+        raise click.ClickException('REPLICA_DIR is not set.')
+    db_path = current_app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
+    target = output or db_path
+    tmp_path = target + '.replica-restore'
+    try:
+        generation, applied, last_time = replication.restore(
+            replica_dir, tmp_path, at=calendar.timegm(at.timetuple()) if at else None)
+        backup_service.check_database(tmp_path)
+    except (replication.ReplicaError, backup_service.RestoreError) as exc:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise click.ClickException(f'Restore FAILED: {exc}')
+    click.echo(f'Generation {generation}: {applied} segment(s) replayed, state as of '
+               f'{datetime.utcfromtimestamp(last_time):%Y-%m-%d %H:%M:%S} UTC.')
+
+    if output:
+        os.replace(tmp_path, output)
+        click.echo(f'Written to {output}.')
+        return
+    if not click.confirm(f'Replace the live database {db_path}?'):
+        os.remove(tmp_path)
+        click.echo('Aborted.')
+        return
+    for engine in db.engines.values():  # main and read-only pools
+        engine.dispose()
+    backup_service.swap_database(tmp_path, db_path)
+    click.echo('Restore complete!')
+
+
+@click.command('bench-sqlite')
+@click.option('--cache-sizes', default='2000,8192,32768', show_default=True,
+              help='Comma-separated cache_size values to try, in KiB.')
+@click.option('--mmap-sizes', default='0,64,256', show_default=True,
+              help='Comma-separated mmap_size values to try, in MiB.')
+@click.option('--runs', type=int, default=20, show_default=True,
+              help='Timed runs per query and setting.')
+@click.option('--users', type=int, default=5, show_default=True,
+              help='Feeds of this many of the most active users per run.')
+@with_appcontext
+def bench_sqlite(cache_sizes, mmap_sizes, runs, users):
+    """Time the feed and leaderboard queries under different SQLite
+    cache_size / mmap_size settings (see app/sqlite_pragmas.py).
+
+    Run it against a copy of the production database, e.g.
+    DATABASE_PATH=/tmp/copy.db flask bench-sqlite. Every setting starts on a
+    fresh connection: "cold" is the first run (empty SQLite cache, warm OS
+    page cache), "warm" the median of the following runs. The leaderboard
+    covers the last 30 days, so results don't depend on the day of month.
+    """
+    import statistics
+    import time
+    from datetime import datetime, timedelta
+    from flask import current_app
+    from . import sqlite_pragmas
+    from .leaderboard.routes import get_leaderboard
+    from .main.routes import get_feed_posts
+    from .models import BeerPost, User
+
+    sample = [uid for (uid,) in db.session.query(BeerPost.user_id).group_by(
+        BeerPost.user_id).order_by(db.func.count(BeerPost.id).desc()).limit(users)]
+    if not sample:
+        raise click.ClickException('No posts in this database; use a copy of production.')
+    since = datetime.utcnow() - timedelta(days=30)
+
+    def feed():
+        for uid in sample:
+            get_feed_posts(db.session.get(User, uid))
+
+    def leaderboard():
+        get_leaderboard(since)
+
+    def timed(fn):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        db.session.remove()  # back to the pool: the connection (and its cache) stays
+        return elapsed * 1000
+
+    click.echo(f'{"cache KiB":>10} {"mmap MiB":>9} {"feed cold":>10} {"feed warm":>10} '
+               f'{"board cold":>11} {"board warm":>11}   (ms)')
+    try:
+        for cache_kb in (int(v) for v in cache_sizes.split(',')):
+            for mmap_mb in (int(v) for v in mmap_sizes.split(',')):
+                sqlite_pragmas.configure(sqlite_pragmas.pragmas_from_config(
+                    current_app.config, cache_size=-cache_kb, mmap_size=mmap_mb * 1024 * 1024))
+                row = []
+                for fn in (feed, leaderboard):
+                    db.session.remove()
+                    db.engine.dispose()
+                    cold = timed(fn)
+                    warm = statistics.median(timed(fn) for _ in range(runs))
+                    row += [cold, warm]
+                click.echo(f'{cache_kb:>10} {mmap_mb:>9} {row[0]:>10.1f} {row[1]:>10.1f} '
+                           f'{row[2]:>11.1f} {row[3]:>11.1f}')
+    finally:
+        sqlite_pragmas.configure(sqlite_pragmas.pragmas_from_config(current_app.config))
+        db.session.remove()
+        db.engine.dispose()
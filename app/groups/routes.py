@@ -4,6 +4,7 @@ from flask import render_template, redirect, url_for, flash, abort, current_app,
 from flask_login import login_required, current_user
 from . import bp
 from ..extensions import db, cache
+from ..read_pool import read_only
 from ..models import Group, GroupMember, GroupJoinRequest, BeerPost, BeerPostGroup, User, Competition
 from .forms import CreateGroupForm, EditGroupForm
 from ..posts.utils import process_upload
@@ -68,6 +69,7 @@ def create():
 
 
 @bp.route('/<int:id>')
+@read_only
 @login_required
 def detail(id):
     group = Group.query.get_or_404(id)
@@ -308,10 +310,10 @@ def approve_request(id, request_id):
     member = GroupMember(user_id=join_req.user_id, group_id=group.id, role='member')
     db.session.add(member)
     db.session.commit()
-    # Invalidate notification cache for all group admins
+    # Invalidate join-request badge cache for all group admins
     admins = GroupMember.query.filter_by(group_id=group.id, role='admin').all()
     for a in admins:
-        cache.delete(f'notif_count:{a.user_id}')
+        cache.delete(f'group_notif_count:{a.user_id}')
     flash(f'{join_req.user.display_name} is toegevoegd aan de groep.', 'success')
     return redirect(url_for('groups.invite', id=group.id))
 
@@ -329,10 +331,10 @@ def reject_request(id, request_id):
 
     join_req.status = 'rejected'
     db.session.commit()
-    # Invalidate notification cache for all group admins
+    # Invalidate join-request badge cache for all group admins
     admins = GroupMember.query.filter_by(group_id=group.id, role='admin').all()
     for a in admins:
-        cache.delete(f'notif_count:{a.user_id}')
+        cache.delete(f'group_notif_count:{a.user_id}')
     flash('Verzoek afgewezen.', 'success')
     return redirect(url_for('groups.invite', id=group.id))
 
@@ -0,0 +1,269 @@
+"""Upload image processing off the request thread.
+
+Uploads are content-addressed: the name is a hash of the uploaded bytes and
+the processing settings, stored sharded as ``ab/cd/<hash>.webp`` below
+UPLOAD_FOLDER. Re-posting the same photo reuses the stored file without
+decoding it again; services/uploads.py counts the references to each file.
+
+A new upload is saved as-is to ``RUNTIME_DIR/uploads-staging`` and its final
+name is returned right away; decoding, resizing and WEBP encoding run in a
+small per-worker process pool, so Pillow's CPU time neither holds a gunicorn
+thread nor competes for the worker's GIL. Until the file exists,
+``/uploads/<name>`` serves a placeholder.
+
+The same decode also writes smaller width variants (``<hash>-<w>w.webp``
+for each of VARIANT_WIDTHS below the upload's max size), which templates
+reference through ``srcset``. Variants are written before the full-size
+file, so once that exists they all do.
+
+The pool is bounded: IMAGE_POOL_WORKERS processes and at most
+IMAGE_QUEUE_MAX queued images per gunicorn worker. When it is full the
+upload is processed inline, as before. Staged files that were never
+finished (e.g. the worker was killed) are picked up again on the next
+worker start.
+"""
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image, ImageOps
+from . import metrics
+
+logger = logging.getLogger('veau')
+
+STAGED_SUFFIX = '.upload'
+HASH_VERSION = b'1'  # bump when convert_image's output changes
+VARIANT_WIDTHS = (64, 160, 400)  # plus the full size (max_size[0])
+STALE_SECONDS = 300  # staged files older than this are considered orphaned
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_pending = 0
+_config = {'staging_dir': None, 'workers': 1, 'queue_max': 8}
+
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="800" height="800" viewBox="0 0 800 800">'
+    '<rect width="800" height="800" fill="#f3f4f6"/>'
+    '<text x="400" y="410" font-family="sans-serif" font-size="32" fill="#9ca3af" '
+    'text-anchor="middle">Foto wordt verwerkt…</text></svg>'
+)
+
+
+def variant_name(filename, width):
+    stem, ext = os.path.splitext(filename)
+    return f'{stem}-{width}w{ext}'
+
+
+def base_name(filename):
+    """The upload a (possibly variant) filename belongs to."""
+    stem, ext = os.path.splitext(filename)
+    head, sep, tail = stem.rpartition('-')
+    if sep and tail.endswith('w') and tail[:-1].isdigit():
+        return head + ext
+    return filename
+
+
+def sized_name(filename, width, upload_folder):
+    """Smallest variant of ``filename`` that is sharp at ``width`` CSS pixels
+    on 2x screens, or ``filename`` itself when it has none."""
+    if not filename or is_pending(filename):
+        return filename
+    for w in VARIANT_WIDTHS:
+        if w >= 2 * width:
+            variant = variant_name(filename, w)
+            if os.path.exists(os.path.join(upload_folder, variant)):
+                return variant
+            break
+    return filename
+
+
+def _save(img, path, quality):
+    tmp_path = path + '.tmp'
+    img.save(tmp_path, 'WEBP', quality=quality, method=4)
+    os.replace(tmp_path, path)
+
+
+def convert_image(src, dest, max_size, quality):
+    """Decode ``src``, fix orientation, shrink and write WEBP to ``dest``
+    plus its width variants (atomically). Removes ``src`` and its sidecar
+    afterwards."""
+    img = Image.open(src)
+
+    # Fix EXIF orientation
+    try:
+        img = ImageOps.exif_transpose(img)
+    except Exception:
+        pass
+
+    # Strip all metadata (EXIF, ICC profiles, etc.)
+    img.thumbnail(tuple(max_size), Image.LANCZOS)
+
+    if img.mode in ('RGBA', 'P', 'LA'):
+        img = img.convert('RGB')
+
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    # Largest first, each variant downscaled from the previous one
+    variant = img
+    for width in sorted((w for w in VARIANT_WIDTHS if w < max_size[0]), reverse=True):
+        if variant.width > width:
+            variant = variant.resize((width, max(1, round(variant.height * width / variant.width))),
+                                     Image.LANCZOS)
+        _save(variant, variant_name(dest, width), quality)
+    _save(img, dest, quality)
+    _discard(src)
+
+
+def _timed_convert(*args):
+    start = time.perf_counter()
+    convert_image(*args)
+    return time.perf_counter() - start
+
+
+def _sidecar(staged):
+    return staged[:-len(STAGED_SUFFIX)] + '.json'
+
+
+def staged_path(filename):
+    return os.path.join(_config['staging_dir'], os.path.basename(filename) + STAGED_SUFFIX)
+
+
+def content_name(path, max_size, quality):
+    """Sharded storage name for the upload at ``path`` with these settings."""
+    digest = hashlib.sha256(HASH_VERSION)
+    digest.update(f' {max_size[0]}x{max_size[1]} q{quality}\n'.encode())
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    key = digest.hexdigest()[:32]
+    return f'{key[:2]}/{key[2:4]}/{key}.webp'
+
+
+def is_pending(filename):
+    """True while an upload (or a variant of it) is staged but not yet converted."""
+    return bool(filename) and _config['staging_dir'] is not None \
+        and os.path.exists(staged_path(base_name(filename)))
+
+
+def _discard(staged):
+    for path in (staged, _sidecar(staged)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid() or _pool._broken:
+        # spawn: never fork a threaded gunicorn worker
+        _pool = ProcessPoolExecutor(max_workers=_config['workers'],
+                                    mp_context=multiprocessing.get_context('spawn'))
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def _done(future, args):
+    global _pending
+    with _pool_lock:
+        _pending -= 1
+        metrics.set_gauge('veau_image_queue_depth', _pending)
+    try:
+        metrics.observe('veau_upload_processing_seconds', future.result())
+        metrics.inc('veau_image_jobs_total', result='done')
+    except BrokenProcessPool:
+        # The process died (OOM, killed): keep the staged file for resume_staged()
+        metrics.inc('veau_image_jobs_total', result='failed')
+        logger.exception('image pool process died: %s', args[0])
+    except Exception:
+        metrics.inc('veau_image_jobs_total', result='failed')
+        logger.exception('image processing failed: %s', args[0])
+        _discard(args[0])
+
+
+def submit(src, dest, max_size, quality):
+    """Queue a conversion. Returns False (nothing queued) when the pool is full."""
+    global _pending
+    args = (src, dest, tuple(max_size), quality)
+    with _pool_lock:
+        if _pending >= _config['queue_max']:
+            return False
+        future = _get_pool().submit(_timed_convert, *args)
+        _pending += 1
+        metrics.set_gauge('veau_image_queue_depth', _pending)
+    future.add_done_callback(lambda f: _done(f, args))
+    return True
+
+
+def store_upload(file_storage, upload_folder, max_size, quality):
+    """Stage an upload and schedule its conversion. Returns the final filename."""
+    incoming = os.path.join(_config['staging_dir'], f'{uuid.uuid4().hex}.part')
+    file_storage.save(incoming)
+    try:
+        filename = content_name(incoming, max_size, quality)
+        dest = os.path.join(upload_folder, filename)
+        if os.path.exists(dest) or is_pending(filename):
+            # Same photo again: keep the stored one (fresh mtime for the GC grace period)
+            if os.path.exists(dest):
+                os.utime(dest)
+            metrics.inc('veau_image_jobs_total', result='dedup')
+            return filename
+        Image.open(incoming).close()  # header only: reject non-images in the request
+        staged = staged_path(filename)
+        os.replace(incoming, staged)
+    finally:
+        if os.path.exists(incoming):
+            os.remove(incoming)
+    with open(_sidecar(staged), 'w') as f:
+        json.dump({'dest': dest, 'max_size': list(max_size), 'quality': quality}, f)
+
+    if not submit(staged, dest, max_size, quality):
+        metrics.inc('veau_image_jobs_total', result='inline')
+        with metrics.timed('veau_upload_processing_seconds'):
+            convert_image(staged, dest, max_size, quality)
+    return filename
+
+
+def resume_staged():
+    """Requeue staged uploads whose worker died before converting them."""
+    cutoff = time.time() - STALE_SECONDS
+    for name in os.listdir(_config['staging_dir']):
+        staged = os.path.join(_config['staging_dir'], name)
+        if not name.endswith(STAGED_SUFFIX) or os.path.getmtime(staged) > cutoff:
+            continue
+        try:
+            with open(_sidecar(staged)) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            continue
+        os.utime(staged)  # claim: other workers now see it as fresh
+        if not submit(staged, job['dest'], job['max_size'], job['quality']):
+            break
+
+
+def init_app(app):
+    from .services import uploads  # noqa: F401  (reference counting listeners)
+
+    _config.update(
+        staging_dir=os.path.join(app.config['RUNTIME_DIR'], 'uploads-staging'),
+        workers=app.config['IMAGE_POOL_WORKERS'],
+        queue_max=app.config['IMAGE_QUEUE_MAX'],
+    )
+    os.makedirs(_config['staging_dir'], exist_ok=True)
+
+    state = {'pid': None}
+
+    @app.before_request
+    def _start_image_pool():
+        if state['pid'] != os.getpid():
+            state['pid'] = os.getpid()
+            metrics.set_gauge('veau_image_pool_workers', _config['workers'])
+            metrics.set_gauge('veau_image_queue_depth', 0)
+            resume_staged()
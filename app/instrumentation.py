@@ -0,0 +1,94 @@
+"""Per-request timing: SQL statement counts, DB time and slow-query logging.
+
+Cursor hooks are attached to every SQLAlchemy Engine, so the numbers cover
+whatever engine a route happens to use. Totals are kept on ``flask.g`` and
+emitted as a ``Server-Timing`` header plus one logfmt line on the ``veau``
+logger per request.
+"""
+
+import logging
+import time
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('veau')
+
+_listening = False
+
+
+# The start time lives on the statement's execution context, not on the
+# pooled connection: a statement that raises never reaches
+# after_cursor_execute, and its context is simply dropped.
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._veau_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_veau_query_start', None)
+    if start is None:
+        return
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if has_request_context() and 'sql_count' in g:
+        g.sql_count += 1
+        g.sql_ms += elapsed_ms
+        threshold = g.slow_query_ms
+    else:
+        threshold = None
+
+    if threshold is not None and elapsed_ms >= threshold:
+        logger.warning(
+            'slow_query ms=%.1f endpoint=%s sql=%r params=%r',
+            elapsed_ms, request.endpoint, ' '.join(statement.split()), parameters,
+            extra={'db_ms': elapsed_ms, 'sql': statement, 'sql_params': parameters},
+        )
+
+
+def init_app(app):
+    """Register request hooks and (once per process) the engine cursor hooks."""
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening = True
+
+    slow_query_ms = app.config.get('SLOW_QUERY_MS', 100)
+    server_timing = app.config.get('SERVER_TIMING_HEADER', True)
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_start = time.perf_counter()
+        g.sql_count = 0
+        g.sql_ms = 0.0
+        g.slow_query_ms = slow_query_ms
+
+    @app.after_request
+    def _emit_request_timing(response):
+        if 'request_start' not in g:
+            return response
+        total_ms = (time.perf_counter() - g.request_start) * 1000
+
+        if server_timing:
+            response.headers.add(
+                'Server-Timing',
+                f'db;dur={g.sql_ms:.1f};desc="{g.sql_count} queries", app;dur={total_ms:.1f}',
+            )
+
+        if request.endpoint != 'static':
+            logger.info(
+                'request method=%s path=%s endpoint=%s status=%s '
+                'total_ms=%.1f db_ms=%.1f db_statements=%d',
+                request.method, request.path, request.endpoint, response.status_code,
+                total_ms, g.sql_ms, g.sql_count,
+                extra={
+                    'endpoint': request.endpoint,
+                    'status': response.status_code,
+                    'total_ms': total_ms,
+                    'db_ms': g.sql_ms,
+                    'db_statements': g.sql_count,
+                },
+            )
+        return response
@@ -2,6 +2,7 @@ from flask import render_template
 from flask_login import login_required, current_user
 from . import bp
 from ..extensions import db
+from ..read_pool import read_only
 from ..models import (User, BeerPost, DrinkingSession, SessionBeer,
                       GroupMember, Group)
 from datetime import datetime
@@ -24,12 +25,21 @@ MONTH_NAMES_NL = [
 
 
 @bp.route('/')
+@read_only
 @login_required
 def index():
     now = datetime.utcnow()
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    month_name = MONTH_NAMES_NL[now.month]
+    gladjakkers, buffels = get_leaderboard(month_start)
+    return render_template('leaderboard/index.html',
+                           gladjakkers=gladjakkers,
+                           buffels=buffels,
+                           month_name=MONTH_NAMES_NL[now.month],
+                           active_nav='leaderboard')
+
 
+def get_leaderboard(month_start):
+    """(gladjakkers, buffels) for the month starting at ``month_start``."""
     # ── Gladjakkers: fastest user per category this month ──
     gladjakkers = []
 
@@ -88,8 +98,4 @@ def index():
         db.desc(db.func.sum(BeerPost.beer_count))
     ).limit(50).all()
 
-    return render_template('leaderboard/index.html',
-                           gladjakkers=gladjakkers,
-                           buffels=buffels,
-                           month_name=month_name,
-                           active_nav='leaderboard')
+    return gladjakkers, buffels
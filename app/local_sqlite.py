@@ -0,0 +1,31 @@
+"""Thread-local SQLite connections for small shared-state files under RUNTIME_DIR.
+
+Used by the cache backend, the rate-limit storage and the notification
+broadcaster. Connections are autocommit, WAL-mode and ``synchronous=OFF``
+(the data is disposable), one per thread, and reopened after a fork so
+gunicorn's ``--preload`` master never shares a handle with its workers.
+"""
+
+import os
+import sqlite3
+import threading
+
+
+class LocalSQLite:
+    def __init__(self, path, schema=()):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self.conn()
+        for statement in schema:
+            conn.execute(statement)
+
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
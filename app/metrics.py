@@ -0,0 +1,322 @@
+"""Prometheus-style metrics aggregated across gunicorn workers.
+
+Each worker keeps counters, gauges and histograms in memory and a background
+thread writes a full snapshot to ``RUNTIME_DIR/metrics/metrics-<pid>.json``
+(atomic rename) every FLUSH_INTERVAL. ``/metrics`` sums every worker's
+snapshot, using live numbers for the worker serving the scrape. When a
+worker's process is gone, its counters and histograms are folded into
+``metrics-retired.json`` and its snapshot deleted, so totals stay monotonic
+across worker restarts. Gauges only come from live workers whose snapshot
+is younger than STALE_AFTER.
+"""
+
+import atexit
+import fcntl
+import hmac
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from flask import g, request, abort
+
+FLUSH_INTERVAL = 5.0  # seconds between snapshot writes per worker
+STALE_AFTER = 3 * FLUSH_INTERVAL  # older snapshots don't contribute gauges
+RETIRED_FILE = 'metrics-retired.json'  # summed counters of exited workers
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name → (type, help). Every metric must be listed here to be exported.
+METRICS = {
+    'veau_http_requests_total': ('counter', 'HTTP requests by route and status code.'),
+    'veau_http_request_duration_seconds': ('histogram', 'HTTP request latency by route.'),
+    'veau_sql_statements_total': ('counter', 'SQL statements executed, by route.'),
+    'veau_sql_duration_seconds_total': ('counter', 'Time spent in SQL statements, by route.'),
+    'veau_cache_requests_total': ('counter', 'Cache lookups by result (hit/miss).'),
+    'veau_upload_processing_seconds': ('histogram', 'Time to decode, resize and encode an upload.'),
+    'veau_ratelimit_rejections_total': ('counter', 'Requests rejected by the rate limiter, by route.'),
+    'veau_image_jobs_total': ('counter', 'Uploads by result (done/failed/inline/dedup).'),
+    'veau_image_queue_depth': ('gauge', 'Uploads queued or converting in the image pools.'),
+    'veau_image_pool_workers': ('gauge', 'Image pool processes (concurrency limit).'),
+    'veau_replication_lag_seconds': ('gauge', 'Seconds since the replica last caught up with the WAL.'),
+    'veau_replication_frames_total': ('counter', 'WAL frames shipped to REPLICA_DIR.'),
+}
+
+_lock = threading.Lock()
+_counters = defaultdict(float)  # (name, labels) → value
+_gauges = {}  # (name, labels) → value
+_histograms = {}  # (name, labels) → {'buckets': (...), 'counts': [...], 'sum': float}
+_metrics_dir = None
+_thread_pid = None
+_thread_lock = threading.Lock()
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Increment a counter."""
+    with _lock:
+        _counters[(name, _labels(labels))] += value
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to this worker's current value (summed across workers)."""
+    with _lock:
+        _gauges[(name, _labels(labels))] = value
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """Record one observation in a histogram."""
+    key = (name, _labels(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets),
+                                       'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(hist['buckets']):
+            if value <= bound:
+                hist['counts'][i] += 1
+                break
+        hist['sum'] += value
+        hist['count'] += 1
+
+
+class timed:
+    """Context manager that observes the elapsed seconds into a histogram."""
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+def _snapshot():
+    with _lock:
+        return {
+            'counters': [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            'gauges': [[name, list(labels), value] for (name, labels), value in _gauges.items()],
+            'histograms': [[name, list(labels), h['buckets'], h['counts'], h['sum'], h['count']]
+                           for (name, labels), h in _histograms.items()],
+        }
+
+
+def flush():
+    """Write this worker's snapshot so other workers can serve it."""
+    if _metrics_dir is None or not (_counters or _gauges or _histograms):
+        return
+    path = os.path.join(_metrics_dir, f'metrics-{os.getpid()}.json')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(snapshots):
+    """Sum ``[(snapshot, include_gauges)]`` into (counters, gauges, histograms)."""
+    counters = defaultdict(float)
+    gauges = defaultdict(float)
+    histograms = {}
+    for snap, with_gauges in snapshots:
+        for name, labels, value in snap['counters']:
+            counters[(name, tuple(map(tuple, labels)))] += value
+        if with_gauges:
+            for name, labels, value in snap.get('gauges', ()):
+                gauges[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, buckets, counts, total, count in snap['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, {'buckets': buckets, 'counts': [0] * len(buckets),
+                                                 'sum': 0.0, 'count': 0})
+            merged['counts'] = [a + b for a, b in zip(merged['counts'], counts)]
+            merged['sum'] += total
+            merged['count'] += count
+    return counters, gauges, histograms
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _retire(path, snap):
+    """Fold a dead worker's counters and histograms into RETIRED_FILE and
+    delete its snapshot; its gauges are dropped. Caller holds the lock."""
+    retired_path = os.path.join(_metrics_dir, RETIRED_FILE)
+    try:
+        retired = _load(retired_path)
+    except FileNotFoundError:
+        retired = {'counters': [], 'histograms': []}
+    counters, _, histograms = _merge([(retired, False), (snap, False)])
+    tmp_path = retired_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [[name, list(labels), h['buckets'], h['counts'], h['sum'], h['count']]
+                           for (name, labels), h in histograms.items()],
+        }, f)
+    os.replace(tmp_path, retired_path)
+    os.unlink(path)
+
+
+def _collect():
+    """Merge all worker snapshots (live data for this process)."""
+    snapshots = [(_snapshot(), True)]
+    own = f'metrics-{os.getpid()}.json'
+    now = time.time()
+    # One scrape at a time, so a snapshot is never both read live and retired
+    with open(os.path.join(_metrics_dir, RETIRED_FILE + '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        for fname in os.listdir(_metrics_dir):
+            if not fname.endswith('.json') or fname in (own, RETIRED_FILE):
+                continue
+            path = os.path.join(_metrics_dir, fname)
+            try:
+                pid = int(fname[len('metrics-'):-len('.json')])
+            except ValueError:
+                continue
+            try:
+                snap = _load(path)
+                if not _pid_alive(pid):
+                    _retire(path, snap)
+                    continue
+                fresh = now - os.stat(path).st_mtime <= STALE_AFTER
+                snapshots.append((snap, fresh))
+            except (OSError, ValueError):
+                continue
+        try:
+            snapshots.append((_load(os.path.join(_metrics_dir, RETIRED_FILE)), False))
+        except (OSError, ValueError):
+            pass
+    return _merge(snapshots)
+
+
+def _fmt_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"'))
+                    for k, v in pairs)
+    return '{' + body + '}'
+
+
+def render():
+    """Render all metrics in the Prometheus text exposition format."""
+    counters, gauges, histograms = _collect()
+    lines = []
+    for name, (mtype, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {mtype}')
+        if mtype == 'histogram':
+            for (hname, labels), h in sorted(histograms.items()):
+                if hname != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(h['buckets'], h['counts']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_fmt_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_bucket{_fmt_labels(labels, [("le", "+Inf")])} {h["count"]}')
+                lines.append(f'{name}_sum{_fmt_labels(labels)} {h["sum"]}')
+                lines.append(f'{name}_count{_fmt_labels(labels)} {h["count"]}')
+        else:
+            values = gauges if mtype == 'gauge' else counters
+            for (cname, labels), value in sorted(values.items()):
+                if cname == name:
+                    lines.append(f'{name}{_fmt_labels(labels)} {value:g}')
+    return '\n'.join(lines) + '\n'
+
+
+class _CacheMetricsProxy:
+    """Wraps a Flask-Caching backend to count hits and misses on get()."""
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def get(self, key):
+        value = self._backend.get(key)
+        inc('veau_cache_requests_total', result='miss' if value is None else 'hit')
+        return value
+
+    def peek(self, key):
+        """get() without counting, for re-reads of a lookup already counted."""
+        return self._backend.get(key)
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+
+def init_app(app, cache, limiter):
+    """Register request hooks, the cache wrapper and the /metrics endpoint."""
+    global _metrics_dir
+    _metrics_dir = os.path.join(app.config['RUNTIME_DIR'], 'metrics')
+    os.makedirs(_metrics_dir, exist_ok=True)
+    atexit.register(flush)
+
+    backends = app.extensions.get('cache', {})
+    if cache in backends and not isinstance(backends[cache], _CacheMetricsProxy):
+        backends[cache] = _CacheMetricsProxy(backends[cache])
+
+    @app.before_request
+    def _ensure_flush_thread():
+        # Started lazily so that each --preload fork gets its own thread.
+        global _thread_pid
+        if _thread_pid == os.getpid():
+            return
+        with _thread_lock:
+            if _thread_pid != os.getpid():
+                _thread_pid = os.getpid()
+                threading.Thread(target=_flush_loop, daemon=True, name='veau-metrics').start()
+
+    @app.after_request
+    def _record_request(response):
+        if request.endpoint in (None, 'static', 'metrics'):
+            return response
+        labels = {'blueprint': request.blueprint or '', 'endpoint': request.endpoint}
+        inc('veau_http_requests_total', status=response.status_code, **labels)
+        if 'request_start' in g:
+            observe('veau_http_request_duration_seconds',
+                    time.perf_counter() - g.request_start, **labels)
+        if 'sql_count' in g:
+            inc('veau_sql_statements_total', g.sql_count, **labels)
+            inc('veau_sql_duration_seconds_total', g.sql_ms / 1000, **labels)
+        return response
+
+    @limiter.exempt
+    def metrics_view():
+        secret = app.config.get('METRICS_SECRET', '')
+        if not secret:
+            abort(404)
+        provided = request.args.get('secret', '')
+        auth = request.headers.get('Authorization', '')
+        if auth.startswith('Bearer '):
+            provided = auth[len('Bearer '):]
+        if not hmac.compare_digest(secret, provided):
+            abort(403)
+        return app.response_class(render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
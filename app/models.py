@@ -1,6 +1,7 @@
 import logging
 from datetime import datetime
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
 from .extensions import db
 
@@ -19,6 +20,10 @@ class User(UserMixin, db.Model):
     is_private = db.Column(db.Boolean, default=False)
     countdown_enabled = db.Column(db.Boolean, default=False)
     hide_own_posts = db.Column(db.Boolean, default=False)
+    # Maintained by services.notifications on write, reset when notifications are opened
+    unread_notification_count = db.Column(db.Integer, default=0, server_default='0')
+    # Read watermark: notifications with id <= this are read
+    last_read_notification_id = db.Column(db.Integer, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     posts = db.relationship('BeerPost', backref='author', lazy='dynamic',
@@ -100,6 +105,8 @@ class Group(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
+    # Lowercased copy of name for indexed case-insensitive @mention lookups
+    name_lower = db.Column(db.String(80), index=True)
     description = db.Column(db.String(500), default='')
     avatar_filename = db.Column(db.String(255), default=None)
     invite_code = db.Column(db.String(20), unique=True, nullable=False)
@@ -112,6 +119,11 @@ class Group(db.Model):
     post_links = db.relationship('BeerPostGroup', backref='group', lazy='dynamic',
                                  cascade='all, delete-orphan')
 
+    @validates('name')
+    def _set_name_lower(self, key, value):
+        self.name_lower = value.lower() if value else value
+        return value
+
     def member_count(self):
         return self.members.count()
 
@@ -189,12 +201,19 @@ class Tag(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
+    # Lowercased copy of name for indexed case-insensitive @mention lookups
+    name_lower = db.Column(db.String(100), index=True)
     created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     use_count = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     created_by = db.relationship('User', backref=db.backref('created_tags', lazy='dynamic'))
 
+    @validates('name')
+    def _set_name_lower(self, key, value):
+        self.name_lower = value.lower() if value else value
+        return value
+
 
 class DrinkingSession(db.Model):
     __tablename__ = 'drinking_sessions'
@@ -409,17 +428,27 @@ class Notification(db.Model):
     __tablename__ = 'notifications'
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     actor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     type = db.Column(db.String(20), nullable=False)
     post_id = db.Column(db.Integer, db.ForeignKey('beer_posts.id'), nullable=True)
-    is_read = db.Column(db.Boolean, default=False, index=True)
+    # Likes/reactions/comments on the same post are coalesced into one row:
+    # actor_id is the latest actor, actor_count how many different people
+    # (the "X en 2 anderen" on the list page; see services/notifications.py)
+    actor_count = db.Column(db.Integer, default=1, server_default='1')
+    # Legacy flag, no longer written — read state is User.last_read_notification_id
+    is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     user = db.relationship('User', foreign_keys=[user_id], backref='notifications')
     actor = db.relationship('User', foreign_keys=[actor_id])
     post = db.relationship('BeerPost')
 
+    __table_args__ = (
+        # List page: WHERE user_id = ? ORDER BY created_at DESC, id DESC (id is the rowid)
+        db.Index('idx_notification_user_created', 'user_id', 'created_at'),
+    )
+
 
 class Achievement(db.Model):
     __tablename__ = 'achievements'
@@ -531,3 +560,37 @@ class CompetitionBeer(db.Model):
         db.UniqueConstraint('competition_id', 'post_id', name='unique_comp_beer'),
         db.Index('idx_comp_beer_comp_user', 'competition_id', 'user_id'),
     )
+
+
+class Job(db.Model):
+    """Outbox row for work done after a request (see services/jobs.py).
+
+    Written in the same transaction as the change that caused it, so a job
+    exists if and only if that change was committed."""
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # NULL once the job has used up its attempts (kept for inspection)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_job_run_at', 'run_at'),
+    )
+
+
+class Upload(db.Model):
+    """Reference count of a stored upload (see services/uploads.py).
+
+    Several rows may point at the same content-addressed file; it is only
+    unused once no user, group or post references it any more."""
+    __tablename__ = 'uploads'
+
+    filename = db.Column(db.String(255), primary_key=True)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -1,24 +1,146 @@
-from flask import render_template
+import json
+import threading
+import time
+from datetime import datetime
+from flask import current_app, jsonify, render_template, request
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
 from . import bp
-from ..extensions import db, cache
+from .. import broadcast
+from ..extensions import db
 from ..models import Notification
+from ..services.notifications import mark_read
+
+PER_PAGE = 30
+POLL_INTERVAL = 1.0  # seconds between event checks per open stream
+PING_INTERVAL = 10.0  # comment lines that detect dropped connections
+
+# Each open stream holds one gunicorn thread; cap them per worker so page
+# requests always have a thread left. Created lazily from SSE_MAX_STREAMS.
+_stream_slots = None
+_stream_slots_lock = threading.Lock()
+
+
+def _parse_cursor(value):
+    """Parse a '<created_at iso>_<id>' cursor. Returns (created_at, id) or None."""
+    try:
+        created_at, notif_id = value.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(notif_id)
+    except (ValueError, AttributeError):
+        return None
 
 
 @bp.route('/')
 @login_required
 def index():
-    notifications = Notification.query.filter_by(
+    # Keyset pagination on (created_at, id): constant cost at any depth
+    query = Notification.query.filter_by(
         user_id=current_user.id
-    ).order_by(Notification.created_at.desc()).limit(50).all()
+    ).options(joinedload(Notification.actor))
 
-    # Mark all as read
-    Notification.query.filter_by(
-        user_id=current_user.id, is_read=False
-    ).update({'is_read': True})
-    db.session.commit()
-    cache.delete(f'notif_count:{current_user.id}')
+    cursor = _parse_cursor(request.args.get('before', ''))
+    if cursor:
+        created_at, notif_id = cursor
+        query = query.filter(db.or_(
+            Notification.created_at < created_at,
+            db.and_(Notification.created_at == created_at, Notification.id < notif_id),
+        ))
+
+    notifications = query.order_by(
+        Notification.created_at.desc(), Notification.id.desc()
+    ).limit(PER_PAGE + 1).all()
 
-    return render_template('notifications/index.html',
+    next_cursor = None
+    if len(notifications) > PER_PAGE:
+        notifications = notifications[:PER_PAGE]
+        last = notifications[-1]
+        next_cursor = f'{last.created_at.isoformat()}_{last.id}'
+
+    # Highlight against the watermark as it was before this visit
+    last_read_id = current_user.last_read_notification_id or 0
+    if not cursor:
+        mark_read(current_user)
+
+    # Render before committing so the loaded rows aren't expired and reloaded
+    html = render_template('notifications/index.html',
                            notifications=notifications,
+                           last_read_id=last_read_id,
+                           next_cursor=next_cursor,
                            active_nav='')
+    db.session.commit()
+    return html
+
+
+def _sse(name, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {name}', f'data: {json.dumps(data)}']
+    return '\n'.join(lines) + '\n\n'
+
+
+def _slots(limit):
+    global _stream_slots
+    with _stream_slots_lock:
+        if _stream_slots is None:
+            _stream_slots = threading.BoundedSemaphore(limit)
+        return _stream_slots
+
+
+@bp.route('/updates')
+@login_required
+def updates():
+    """Polling counterpart of /stream (the default): the unread count and
+    the events after ``after``, the last event id the page has seen (rendered
+    into it as data-notification-after). One short request with an indexed
+    read; no thread is held between polls."""
+    after_id = request.args.get('after', 0, type=int)
+    events = broadcast.poll(current_user.id, after_id)
+    last_id = events[-1][0] if events else after_id
+    return jsonify(count=current_user.unread_notification_count or 0, last_id=last_id,
+                   events=[{'event': name, 'data': data} for _, name, data in events])
+
+
+@bp.route('/stream')
+@login_required
+def stream():
+    """Server-sent events: unread count changes and new notification previews.
+
+    Streams are short-lived (SSE_STREAM_SECONDS); the browser reconnects with
+    Last-Event-ID and picks up anything it missed. When this worker has no
+    free stream slot the client gets the current count and a long retry
+    interval instead, so it degrades to cheap polling."""
+    user_id = current_user.id
+    count = current_user.unread_notification_count or 0
+    try:
+        after_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        after_id = broadcast.latest_id()
+    lifetime = current_app.config['SSE_STREAM_SECONDS']
+    retry_ms = current_app.config['SSE_RETRY_SECONDS'] * 1000
+    slots = _slots(current_app.config['SSE_MAX_STREAMS'])
+
+    # Plain generator: runs after the request context is gone, touches only
+    # the broadcaster
+    def events():
+        if not slots.acquire(blocking=False):
+            yield f'retry: {retry_ms * 10}\n\n' + _sse('unread', {'count': count})
+            return
+        try:
+            yield f'retry: {retry_ms}\n\n' + _sse('unread', {'count': count})
+            last_id = after_id
+            deadline = time.monotonic() + lifetime
+            next_ping = time.monotonic() + PING_INTERVAL
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                for event_id, name, data in broadcast.poll(user_id, last_id):
+                    last_id = event_id
+                    yield _sse(name, data, event_id)
+                if time.monotonic() >= next_ping:
+                    next_ping = time.monotonic() + PING_INTERVAL
+                    yield ': ping\n\n'
+        finally:
+            slots.release()
+
+    return current_app.response_class(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
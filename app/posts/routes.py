@@ -1,5 +1,6 @@
 import re
 import json
+from collections import Counter
 from flask import render_template, redirect, url_for, flash, request, abort, current_app, jsonify
 from flask_login import login_required, current_user
 from . import bp
@@ -9,30 +10,48 @@ from ..models import (BeerPost, BeerPostGroup, Comment, GroupMember, DrinkingSes
                       SessionBeer, Tag, User, Group)
 from .forms import BeerPostForm, CommentForm, SessionPostForm
 from .utils import process_upload
-from ..services.achievements import check_achievements
 from ..services.competitions import update_competition_counts
+from ..services.jobs import enqueue
 
+MENTION_RE = re.compile(r'@(\w+)')
 
-def extract_and_save_tags(comment_text):
-    """Extract @mentions from caption and save unknown ones as tags."""
-    if not comment_text:
+
+def extract_and_save_tags(*texts):
+    """Save @mentions that aren't users or groups as tags (or bump their use count).
+
+    All mentions in the given texts are resolved together: one indexed lookup
+    each for users, groups and tags, and one UPDATE for the existing tags."""
+    counts = Counter()
+    spelling = {}
+    for text in texts:
+        for name in MENTION_RE.findall(text or ''):
+            counts[name.lower()] += 1
+            spelling.setdefault(name.lower(), name)
+    if not counts:
         return
-    mentions = re.findall(r'@(\w+)', comment_text)
-    for name in mentions:
-        # Skip if it's a user
-        if User.query.filter(db.func.lower(User.username) == name.lower()).first():
-            continue
-        # Skip if it's a group (underscores back to spaces for matching)
-        group_name = name.replace('_', ' ')
-        if Group.query.filter(db.func.lower(Group.name) == group_name.lower()).first():
-            continue
-        # Upsert tag
-        existing = Tag.query.filter(db.func.lower(Tag.name) == name.lower()).first()
-        if existing:
-            existing.use_count = (existing.use_count or 0) + 1
-        else:
-            tag = Tag(name=name, created_by_id=current_user.id, use_count=1)
-            db.session.add(tag)
+
+    # Usernames are stored lowercase
+    known = {r[0] for r in db.session.query(User.username).filter(User.username.in_(counts))}
+    # Groups: underscores back to spaces for matching
+    group_keys = {k.replace('_', ' '): k for k in counts if k not in known}
+    if group_keys:
+        known.update(group_keys[r[0]] for r in db.session.query(Group.name_lower).filter(
+            Group.name_lower.in_(group_keys)))
+
+    tag_keys = [k for k in counts if k not in known]
+    if not tag_keys:
+        return
+    existing = {r[0] for r in db.session.query(Tag.name_lower).filter(Tag.name_lower.in_(tag_keys))}
+    if existing:
+        Tag.query.filter(Tag.name_lower.in_(existing)).update(
+            {Tag.use_count: db.func.coalesce(Tag.use_count, 0)
+             + db.case({k: counts[k] for k in existing}, value=Tag.name_lower)},
+            synchronize_session=False,
+        )
+    for key in tag_keys:
+        if key not in existing:
+            db.session.add(Tag(name=spelling[key], created_by_id=current_user.id,
+                               use_count=counts[key]))
 
 
 @bp.route('/create', methods=['GET', 'POST'])
@@ -164,6 +183,7 @@ def create_session():
         fastest_time = min(timed_values) if timed_values else None
 
         # Create SessionBeer records; auto-VDL anything slower than fastest
+        beer_notes = []
         for beer_data in beers_data:
             beer_time = beer_data.get('time')
             beer_is_vdl = beer_data.get('is_vdl', False)
@@ -220,10 +240,8 @@ def create_session():
                 note=beer_note
             )
             db.session.add(session_beer)
-
-            # Extract tags from beer note
             if beer_note:
-                extract_and_save_tags(beer_note)
+                beer_notes.append(beer_note)
 
         # Photo
         photo_filename = None
@@ -251,8 +269,11 @@ def create_session():
             link = BeerPostGroup(post_id=post.id, group_id=group_id)
             db.session.add(link)
 
-        extract_and_save_tags(form.caption.data)
+        # Tags from the caption and all beer notes in one pass
+        extract_and_save_tags(form.caption.data, *beer_notes)
         update_competition_counts(post)
+        # Achievements are checked in the background (pushed to the client)
+        enqueue('check_achievements', user_id=current_user.id)
         db.session.commit()
 
         # Check for competition wins
@@ -277,11 +298,6 @@ def create_session():
         if not has_pb:
             flash('Sessie gepost!', 'success')
 
-        # Check achievements
-        new_achievements = check_achievements(current_user)
-        for ach in new_achievements:
-            flash(f'{ach.icon} Prestatie ontgrendeld: {ach.name}!', 'success')
-
         return redirect(url_for('posts.detail', id=post.id))
 
     flash('Something went wrong.', 'error')
@@ -1,6 +1,4 @@
-import os
-import uuid
-from PIL import Image, ImageOps
+from .. import image_pool
 
 
 ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
@@ -11,22 +9,8 @@ def allowed_file(filename):
 
 
 def process_upload(file_storage, upload_folder, max_size=(800, 800), quality=70):
-    filename = f"{uuid.uuid4().hex}.webp"
-    filepath = os.path.join(upload_folder, filename)
+    """Store an uploaded image as WEBP and return its filename.
 
-    img = Image.open(file_storage)
-
-    # Fix EXIF orientation
-    try:
-        img = ImageOps.exif_transpose(img)
-    except Exception:
-        pass
-
-    # Strip all metadata (EXIF, ICC profiles, etc.)
-    img.thumbnail(max_size, Image.LANCZOS)
-
-    if img.mode in ('RGBA', 'P', 'LA'):
-        img = img.convert('RGB')
-
-    img.save(filepath, 'WEBP', quality=quality, method=4)
-    return filename
+    The conversion runs in the image pool (see app/image_pool.py); the file
+    may not exist yet when this returns."""
+    return image_pool.store_upload(file_storage, upload_folder, max_size, quality)
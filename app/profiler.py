@@ -0,0 +1,176 @@
+"""On-demand sampling profiler for production workers.
+
+Arming writes a small state file under ``RUNTIME_DIR`` so that every gunicorn
+worker picks it up. The next N requests to the chosen endpoint (across all
+workers) run with a background thread sampling the request thread's stack;
+samples are appended as collapsed stacks (``a;b;c count``) to one file per
+worker and merged on download, ready for ``flamegraph.pl`` or speedscope.
+
+When nothing is armed the per-request cost is a timestamp comparison; the
+state file is only stat'ed once per second per worker.
+"""
+
+import fcntl
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from flask import g, request
+
+STATE_FILE = 'profile-armed.json'
+STACKS_PREFIX = 'profile-stacks-'
+CHECK_INTERVAL = 1.0  # seconds between state-file checks per worker
+
+_state = {'next_check': 0.0, 'mtime': None, 'armed': None}
+_state_lock = threading.Lock()
+
+
+def _profile_dir(app):
+    path = os.path.join(app.config['RUNTIME_DIR'], 'profiles')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class _StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval."""
+
+    def __init__(self, target_ident, interval):
+        super().__init__(daemon=True, name='veau-profiler')
+        self.target_ident = target_ident
+        self.interval = interval
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_ident)
+            names = []
+            while frame is not None:
+                module = frame.f_globals.get('__name__', '?')
+                names.append(f'{module}:{frame.f_code.co_qualname}')
+                frame = frame.f_back
+            if names:
+                self.samples[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.samples
+
+
+def _armed_endpoint(app):
+    """Return the armed state dict if profiling is on, else None (cheap when off)."""
+    now = time.monotonic()
+    if now < _state['next_check']:
+        return _state['armed']
+
+    with _state_lock:
+        _state['next_check'] = now + CHECK_INTERVAL
+        path = os.path.join(_profile_dir(app), STATE_FILE)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            _state['mtime'] = None
+            _state['armed'] = None
+            return None
+        if mtime != _state['mtime']:
+            _state['mtime'] = mtime
+            try:
+                with open(path) as f:
+                    armed = json.load(f)
+            except (OSError, ValueError):
+                armed = None
+            _state['armed'] = armed if armed and armed.get('remaining', 0) > 0 else None
+        return _state['armed']
+
+
+def _claim_slot(app):
+    """Atomically take one of the remaining profile slots. Returns the state or None."""
+    path = os.path.join(_profile_dir(app), STATE_FILE)
+    try:
+        with open(path, 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                armed = json.load(f)
+            except ValueError:
+                return None
+            if armed.get('remaining', 0) <= 0:
+                _state['armed'] = None
+                return None
+            armed['remaining'] -= 1
+            f.seek(0)
+            f.truncate()
+            json.dump(armed, f)
+            return armed
+    except FileNotFoundError:
+        return None
+
+
+def _write_samples(app, samples):
+    path = os.path.join(_profile_dir(app), f'{STACKS_PREFIX}{os.getpid()}.txt')
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        for stack, count in samples.items():
+            f.write(f'{stack} {count}\n')
+
+
+def arm(app, endpoint, count, interval):
+    """Profile the next ``count`` requests to ``endpoint``. Discards earlier samples."""
+    directory = _profile_dir(app)
+    for fname in os.listdir(directory):
+        if fname.startswith(STACKS_PREFIX):
+            os.remove(os.path.join(directory, fname))
+    tmp_path = os.path.join(directory, STATE_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'endpoint': endpoint, 'remaining': count, 'interval': interval,
+                   'armed_at': time.time()}, f)
+    os.replace(tmp_path, os.path.join(directory, STATE_FILE))
+
+
+def status(app):
+    """Return the current armed state (or None) without touching the cache."""
+    path = os.path.join(_profile_dir(app), STATE_FILE)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def collapsed_stacks(app):
+    """Merge all workers' samples into one collapsed-stack text blob."""
+    directory = _profile_dir(app)
+    totals = Counter()
+    for fname in os.listdir(directory):
+        if not fname.startswith(STACKS_PREFIX):
+            continue
+        with open(os.path.join(directory, fname)) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    totals[stack] += int(count)
+    return ''.join(f'{stack} {count}\n' for stack, count in totals.most_common())
+
+
+def init_app(app):
+    """Register request hooks that start/stop the sampler for armed requests."""
+
+    @app.before_request
+    def _maybe_start_profiler():
+        armed = _armed_endpoint(app)
+        if armed is None or armed.get('endpoint') != request.endpoint:
+            return
+        claimed = _claim_slot(app)
+        if claimed is None:
+            return
+        sampler = _StackSampler(threading.get_ident(), claimed.get('interval', 0.005))
+        sampler.start()
+        g.profiler = sampler
+
+    @app.teardown_request
+    def _maybe_stop_profiler(exc):
+        sampler = g.pop('profiler', None)
+        if sampler is not None:
+            _write_samples(app, sampler.stop())
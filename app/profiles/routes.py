@@ -4,6 +4,7 @@ from sqlalchemy.orm import joinedload
 from collections import OrderedDict
 from . import bp
 from ..extensions import db
+from ..read_pool import read_only
 from ..models import (User, Connection, BeerPost, SessionBeer, DrinkingSession,
                       Like, Comment, Achievement, UserAchievement, Competition)
 from .forms import EditProfileForm
@@ -14,6 +15,7 @@ from datetime import datetime, date as dt_date, timedelta
 
 
 @bp.route('/u/<username>')
+@read_only
 @login_required
 def view(username):
     user = User.query.filter_by(username=username).first_or_404()
@@ -308,6 +310,7 @@ def reject_request(id):
 
 
 @bp.route('/u/<username>/connections')
+@read_only
 @login_required
 def connections(username):
     user = User.query.filter_by(username=username).first_or_404()
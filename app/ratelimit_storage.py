@@ -0,0 +1,81 @@
+"""SQLite storage for Flask-Limiter, shared by all gunicorn workers.
+
+With ``memory://`` every worker counts on its own, so a "1 per minute" limit
+is really "1 per minute per worker". This backend keeps fixed-window counters
+in one WAL-mode SQLite file; each hit is a single upsert (tens of
+microseconds), which keeps limits exact without an external Redis.
+
+Importing this module registers the ``sqlite://`` scheme with ``limits``:
+``sqlite:///relative/path.db`` or ``sqlite:////absolute/path.db``.
+"""
+
+import sqlite3
+import time
+from limits.storage import Storage
+from .local_sqlite import LocalSQLite
+
+PRUNE_EVERY = 1000  # hits between expired-row cleanups (per process)
+
+
+class SQLiteStorage(Storage):
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri.split('://', 1)[1][1:]
+        self._hits = 0
+        self._db = LocalSQLite(self.path, schema=(
+            'CREATE TABLE IF NOT EXISTS limits ('
+            ' key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL'
+            ') WITHOUT ROWID',
+        ))
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _conn(self):
+        return self._db.conn()
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            'INSERT INTO limits (key, count, expires_at) VALUES (?1, ?2, ?3) '
+            'ON CONFLICT(key) DO UPDATE SET '
+            ' count = CASE WHEN expires_at <= ?4 THEN excluded.count ELSE count + excluded.count END,'
+            ' expires_at = CASE WHEN expires_at <= ?4 OR ?5 THEN excluded.expires_at ELSE expires_at END '
+            'RETURNING count',
+            (key, amount, now + expiry, now, int(bool(elastic_expiry))),
+        ).fetchone()
+
+        self._hits += 1
+        if self._hits % PRUNE_EVERY == 0:
+            conn.execute('DELETE FROM limits WHERE expires_at <= ?', (now,))
+        return row[0]
+
+    def get(self, key):
+        row = self._conn().execute(
+            'SELECT count FROM limits WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        now = time.time()
+        row = self._conn().execute(
+            'SELECT expires_at FROM limits WHERE key = ? AND expires_at > ?', (key, now)
+        ).fetchone()
+        return row[0] if row else now
+
+    def check(self):
+        try:
+            self._conn().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._conn().execute('DELETE FROM limits').rowcount
+
+    def clear(self, key):
+        self._conn().execute('DELETE FROM limits WHERE key = ?', (key,))
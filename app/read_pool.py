@@ -0,0 +1,74 @@
+"""Separate read-only connection pool for read-heavy GET pages.
+
+Views marked ``@read_only`` (leaderboard, group detail, profiles) run their
+SELECTs on a second engine, the ``readonly`` bind, which opens the database
+file with ``mode=ro`` and ``PRAGMA query_only``. Their long aggregate
+queries then no longer take connections from the main pool, which keeps
+serving writes (likes, reactions, posts) and every other route. Under WAL
+the two never block each other.
+
+Routing happens in the session: only SELECT statements go to the read-only
+engine, so a marked view can still write (a flush, an UPDATE) through the
+main pool, e.g. the group page's ``last_seen_at``.
+"""
+
+import functools
+import sqlite3
+from urllib.parse import quote
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+
+READ_BIND = 'readonly'
+
+
+class QueryOnlyConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.execute('PRAGMA query_only=1')
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and getattr(clause, 'is_select', False)
+                and has_request_context() and g.get('read_only_db')
+                and READ_BIND in self._db.engines):
+            return self._db.engines[READ_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Run the view's SELECTs on the read-only pool (GET/HEAD only)."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            g.read_only_db = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def init_app(app):
+    """Configure the read-only bind and the main pool. Call before db.init_app.
+
+    Both pools are fixed-size (no overflow connections): a thread that finds
+    its pool empty waits up to SQLITE_POOL_TIMEOUT seconds for a connection.
+    """
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not uri.startswith('sqlite:///'):
+        return
+    path = uri[len('sqlite:///'):]
+    if path in ('', ':memory:'):
+        return  # StaticPool, one shared connection
+    limits = {'max_overflow': 0, 'pool_timeout': app.config['SQLITE_POOL_TIMEOUT']}
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    options.setdefault('pool_size', app.config['SQLITE_WRITE_POOL_SIZE'])
+    for name, value in limits.items():
+        options.setdefault(name, value)
+    if app.config['SQLITE_READ_POOL_SIZE'] <= 0:
+        return
+    # Binds don't inherit SQLALCHEMY_ENGINE_OPTIONS.
+    app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, **{READ_BIND: {
+        'url': f'sqlite:///file:{quote(path)}?mode=ro&uri=true',
+        'pool_size': app.config['SQLITE_READ_POOL_SIZE'],
+        **limits,
+        'connect_args': {'factory': QueryOnlyConnection},
+    }})
@@ -0,0 +1,335 @@
+"""Continuous replication of the SQLite database by shipping WAL frames.
+
+``flask replicate`` runs next to the web workers and copies every committed
+transaction from ``<db>-wal`` to REPLICA_DIR within about a second, in the
+style of litestream::
+
+    REPLICA_DIR/<generation>/snapshot.db      page-for-page copy at the start
+    REPLICA_DIR/<generation>/segments.jsonl   one line per shipped segment
+    REPLICA_DIR/<generation>/wal/<seq>.frames raw WAL frames (whole transactions)
+
+A generation is a snapshot plus every transaction after it, so any moment
+since the snapshot can be rebuilt with ``flask restore-replica --at``. A new
+generation starts every REPLICA_SNAPSHOT_HOURS, and whenever continuity
+can't be proven (replicator restarted, WAL reset by someone else).
+
+Continuity rests on one rule: while REPLICA_DIR is set, the app's own
+connections don't checkpoint (``wal_autocheckpoint=0``, see
+sqlite_pragmas.py); the replicator
+checkpoints itself, holding the write lock while it ships the last frames.
+The WAL can therefore only be reset right after a checkpoint of frames
+that are already shipped, and any other reset is detected by its salt.
+"""
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import struct
+import time
+import uuid
+from datetime import datetime
+from . import metrics
+
+logger = logging.getLogger('veau')
+
+WAL_HEADER_SIZE = 32
+FRAME_HEADER_SIZE = 24
+
+
+class ReplicaError(Exception):
+    pass
+
+
+# ── WAL parsing ──────────────────────────────────────────
+
+def _checksum(data, s1, s2, big_endian):
+    """SQLite's WAL checksum of ``data`` (a multiple of 8 bytes), seeded."""
+    words = struct.unpack(('>' if big_endian else '<') + f'{len(data) // 4}I', data)
+    for i in range(0, len(words), 2):
+        s1 = (s1 + words[i] + s2) & 0xFFFFFFFF
+        s2 = (s2 + words[i + 1] + s1) & 0xFFFFFFFF
+    return s1, s2
+
+
+def read_wal_header(f):
+    """(page_size, checkpoint_seq, salt1, salt2, cksum, big_endian) or None."""
+    f.seek(0)
+    header = f.read(WAL_HEADER_SIZE)
+    if len(header) < WAL_HEADER_SIZE:
+        return None
+    magic, _, page_size, ckpt_seq, salt1, salt2, c1, c2 = struct.unpack('>8I', header)
+    if magic not in (0x377F0682, 0x377F0683):
+        return None
+    big_endian = bool(magic & 1)
+    if _checksum(header[:24], 0, 0, big_endian) != (c1, c2):
+        return None
+    return page_size, ckpt_seq, salt1, salt2, (c1, c2), big_endian
+
+
+def read_transactions(f, position):
+    """Committed frames after ``position``: (bytes, frame count, new position).
+
+    Reading stops at the first frame that is incomplete, has other salts
+    (left over from before a reset) or fails the checksum chain; frames of
+    a transaction that isn't committed yet are left for the next call."""
+    frame_size = FRAME_HEADER_SIZE + position['page_size']
+    f.seek(position['offset'])
+    cksum = tuple(position['cksum'])
+    chunks, pending, frames, pending_frames = [], [], 0, 0
+    offset = committed_offset = position['offset']
+    committed_cksum = cksum
+    while True:
+        frame = f.read(frame_size)
+        if len(frame) < frame_size:
+            break
+        _, commit_size, salt1, salt2, c1, c2 = struct.unpack('>6I', frame[:FRAME_HEADER_SIZE])
+        if (salt1, salt2) != (position['salt1'], position['salt2']):
+            break
+        cksum = _checksum(frame[:8] + frame[FRAME_HEADER_SIZE:], *cksum, position['big_endian'])
+        if cksum != (c1, c2):
+            break
+        pending.append(frame)
+        pending_frames += 1
+        offset += frame_size
+        if commit_size:
+            chunks += pending
+            frames += pending_frames
+            pending, pending_frames = [], 0
+            committed_offset, committed_cksum = offset, cksum
+    return b''.join(chunks), frames, dict(position, offset=committed_offset, cksum=committed_cksum)
+
+
+def wal_start_position(header):
+    page_size, _, salt1, salt2, cksum, big_endian = header
+    return {'page_size': page_size, 'salt1': salt1, 'salt2': salt2,
+            'cksum': cksum, 'big_endian': big_endian, 'offset': WAL_HEADER_SIZE}
+
+
+# ── Replicator ───────────────────────────────────────────
+
+class Replicator:
+    def __init__(self, db_path, replica_dir, checkpoint_pages=1000, snapshot_hours=24,
+                 retention_hours=72):
+        self.db_path = db_path
+        self.wal_path = db_path + '-wal'
+        self.replica_dir = replica_dir
+        self.checkpoint_pages = checkpoint_pages
+        self.snapshot_seconds = snapshot_hours * 3600
+        self.retention_seconds = retention_hours * 3600
+        self.generation = None
+        self.position = None  # None: no WAL header seen yet
+        self.allow_reset = False
+        self.seq = 0
+        self.synced_at = time.time()
+        # Kept open for the replicator's lifetime: as long as a connection
+        # exists, SQLite never checkpoints-and-deletes the WAL on close
+        self._read = self._connect()
+        self._write = self._connect()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA wal_autocheckpoint=0')
+        return conn
+
+    def _gen_dir(self, *parts):
+        return os.path.join(self.replica_dir, self.generation, *parts)
+
+    def _scan_position(self):
+        """Position at the end of the WAL (writers must be locked out)."""
+        try:
+            with open(self.wal_path, 'rb') as f:
+                header = read_wal_header(f)
+                if header is None:
+                    return None
+                return read_transactions(f, wal_start_position(header))[2]
+        except FileNotFoundError:
+            return None
+
+    def new_generation(self):
+        """Snapshot the database and start shipping from that point."""
+        generation = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ-') + uuid.uuid4().hex[:6]
+        os.makedirs(os.path.join(self.replica_dir, generation, 'wal'))
+        snapshot_tmp = os.path.join(self.replica_dir, generation, 'snapshot.db.tmp')
+
+        # Pin a read snapshot exactly at the end of the WAL, then copy it
+        # page for page (the backup API keeps the layout WAL frames refer to)
+        locked = self._write.in_transaction  # called from checkpoint()
+        if not locked:
+            self._write.execute('BEGIN IMMEDIATE')
+        try:
+            position = self._scan_position()
+            self._read.execute('BEGIN')
+            self._read.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchall()
+        finally:
+            if not locked:
+                self._write.execute('COMMIT')
+        try:
+            dest = sqlite3.connect(snapshot_tmp)
+            try:
+                self._read.backup(dest)
+            finally:
+                dest.close()
+        finally:
+            self._read.execute('COMMIT')
+        os.replace(snapshot_tmp, os.path.join(self.replica_dir, generation, 'snapshot.db'))
+        with open(os.path.join(self.replica_dir, generation, 'meta.json'), 'w') as f:
+            json.dump({'created_at': time.time()}, f)
+
+        self.generation, self.position, self.seq = generation, position, 0
+        self.allow_reset = True  # a reset right after a locked scan loses nothing
+        self.created_at = time.time()
+        logger.info('Replication: new generation %s', generation)
+        self._prune()
+
+    def _write_segment(self, data, frames):
+        self.seq += 1
+        name = f'{self.seq:010d}.frames'
+        tmp = self._gen_dir('wal', name + '.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._gen_dir('wal', name))
+        entry = {'seq': self.seq, 'file': name, 'time': time.time(), 'frames': frames,
+                 'page_size': self.position['page_size']}
+        with open(self._gen_dir('segments.jsonl'), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        metrics.inc('veau_replication_frames_total', frames)
+
+    def ship(self):
+        """Copy the frames committed since the last call to a new segment."""
+        try:
+            f = open(self.wal_path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            header = read_wal_header(f)
+            if header is None:
+                return
+            start = wal_start_position(header)
+            if self.position is None:
+                self.position = start
+            elif (start['salt1'], start['salt2']) != (self.position['salt1'], self.position['salt2']):
+                # The WAL was reset (salt-1 goes up by one each time). Fine
+                # once right after our own checkpoint; anything else may have
+                # dropped frames we never saw
+                next_salt = (self.position['salt1'] + 1) & 0xFFFFFFFF
+                if not (self.allow_reset and start['salt1'] == next_salt):
+                    logger.warning('Replication: unexpected WAL reset, starting a new generation')
+                    self.new_generation()
+                    return
+                self.position = start
+            data, frames, position = read_transactions(f, self.position)
+            if frames:
+                self._write_segment(data, frames)
+                self.position = position
+                self.allow_reset = False
+
+    def checkpoint(self):
+        """Ship the last frames with writers locked out, then checkpoint."""
+        try:
+            self._write.execute('BEGIN IMMEDIATE')
+        except sqlite3.OperationalError:
+            return  # busy; next round
+        try:
+            self.ship()
+            self._read.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchall()
+            self.allow_reset = True
+        finally:
+            self._write.execute('COMMIT')
+
+    def _wal_frames(self):
+        """Frames in the current WAL up to the shipped position. (The file
+        itself never shrinks: after a reset SQLite writes over it from the
+        start, so its size says nothing about the live frames.)"""
+        if not self.position:
+            return 0
+        frame_size = FRAME_HEADER_SIZE + self.position['page_size']
+        return (self.position['offset'] - WAL_HEADER_SIZE) // frame_size
+
+    def _prune(self):
+        """Drop generations whose successor started before the retention window."""
+        cutoff = time.time() - self.retention_seconds
+        generations = list_generations(self.replica_dir)
+        for (name, _), (_, next_created) in zip(generations, generations[1:]):
+            if next_created < cutoff and name != self.generation:
+                shutil.rmtree(os.path.join(self.replica_dir, name), ignore_errors=True)
+
+    def step(self):
+        """One round: ship, and checkpoint when the WAL has grown long."""
+        started = time.time()
+        if self.generation is None or started - self.created_at > self.snapshot_seconds:
+            self.new_generation()
+        self.ship()
+        # allow_reset: checkpointed, and nothing written since; another
+        # checkpoint would only take the write lock from the app again
+        if not self.allow_reset and self._wal_frames() >= self.checkpoint_pages:
+            self.checkpoint()
+        self.synced_at = started  # everything committed before this is shipped
+
+    def report_lag(self):
+        """Age of the newest state known to be in the replica."""
+        metrics.set_gauge('veau_replication_lag_seconds', time.time() - self.synced_at)
+
+    def close(self):
+        self._read.close()
+        self._write.close()
+
+
+def list_generations(replica_dir):
+    """[(name, created_at)] of complete generations, oldest first."""
+    generations = []
+    if not os.path.isdir(replica_dir):
+        return generations
+    for name in os.listdir(replica_dir):
+        try:
+            with open(os.path.join(replica_dir, name, 'meta.json')) as f:
+                generations.append((name, json.load(f)['created_at']))
+        except (OSError, ValueError, KeyError):
+            continue
+    return sorted(generations, key=lambda g: g[1])
+
+
+# ── Point-in-time restore ────────────────────────────────
+
+def restore(replica_dir, dest, at=None):
+    """Rebuild the database as of ``at`` (epoch seconds, default: latest) into
+    ``dest``. Returns (generation, segments applied, time of the last one)."""
+    at = time.time() if at is None else at
+    candidates = [g for g in list_generations(replica_dir) if g[1] <= at]
+    if not candidates:
+        raise ReplicaError('no replica generation starts before that time')
+    generation, created_at = candidates[-1]
+    gen_dir = os.path.join(replica_dir, generation)
+
+    shutil.copyfile(os.path.join(gen_dir, 'snapshot.db'), dest)
+    applied, last_time = 0, created_at
+    try:
+        with open(os.path.join(gen_dir, 'segments.jsonl')) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        entries = []
+    with open(dest, 'r+b') as db_file:
+        for entry in entries:
+            if entry['time'] > at:
+                break
+            page_size = entry['page_size']
+            frame_size = FRAME_HEADER_SIZE + page_size
+            with open(os.path.join(gen_dir, 'wal', entry['file']), 'rb') as seg:
+                data = seg.read()
+            # Same as a checkpoint: write each page in place, and set the
+            # file size at every commit frame
+            for i in range(0, len(data), frame_size):
+                pgno, commit_size = struct.unpack('>2I', data[i:i + 8])
+                db_file.seek((pgno - 1) * page_size)
+                db_file.write(data[i + FRAME_HEADER_SIZE:i + frame_size])
+                if commit_size:
+                    db_file.truncate(commit_size * page_size)
+            applied += 1
+            last_time = entry['time']
+    return generation, applied, last_time
+
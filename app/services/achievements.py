@@ -1,7 +1,9 @@
 """Achievement checking — extracted from posts/routes.py."""
 
+from .. import broadcast
 from ..extensions import db
-from ..models import Achievement, UserAchievement
+from ..models import Achievement, User, UserAchievement
+from .jobs import job_handler
 from .stats import get_user_achievement_stats
 
 
@@ -68,3 +70,14 @@ def check_achievements(user):
         db.session.commit()
 
     return newly_unlocked
+
+
+@job_handler('check_achievements')
+def check_achievements_job(user_id):
+    """Background variant (enqueued on posting): award and push a toast."""
+    user = db.session.get(User, user_id)
+    if user is None:
+        return
+    for ach in check_achievements(user):
+        broadcast.publish_after_commit(db.session, user.id, 'achievement',
+                                       {'icon': ach.icon, 'name': ach.name})
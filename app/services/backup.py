@@ -0,0 +1,374 @@
+"""Backup archives of the database and uploads, streamed.
+
+A backup is a ``.tar.gz`` holding, in this order:
+
+* ``backup.json`` — ``{"format": 2, "created_at": <epoch>, "since": <epoch or null>}``
+* ``bierstrava.db`` — a compact snapshot of the database
+* ``uploads/<path>`` — every upload, or for an incremental backup only
+  those modified at or after ``since``
+* ``manifest.jsonl`` — one ``[path, size, sha256]`` line for *every* upload
+  that existed when the backup was taken, so a restore of a full backup
+  plus its deltas can tell what should be there and check it
+
+Upload hashes are cached in ``RUNTIME_DIR/upload-hashes.sqlite`` keyed by
+path, size and mtime, so only new files are read for the manifest.
+
+The archive is produced by a background thread that writes the tar/gzip
+stream into a small bounded queue; the response generator drains that
+queue, so memory use stays at a few chunks whatever the size of the
+backup, and a slow client simply pauses the producer.
+
+The database is copied with ``VACUUM INTO``: one read transaction (writers
+carry on under WAL) that writes a compact, defragmented copy page by page.
+"""
+
+import hashlib
+import io
+import json
+import os
+import queue
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import threading
+import time
+from ..local_sqlite import LocalSQLite
+
+FORMAT = 2
+DB_ARCNAME = 'bierstrava.db'
+META_ARCNAME = 'backup.json'
+MANIFEST_ARCNAME = 'manifest.jsonl'
+CHUNK_SIZE = 256 * 1024  # bytes per queued chunk
+QUEUE_CHUNKS = 16  # chunks buffered between producer and response
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _QueueWriter:
+    """File-like sink for tarfile that hands full chunks to a queue."""
+
+    def __init__(self, chunks, cancelled):
+        self._chunks = chunks
+        self._cancelled = cancelled
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= CHUNK_SIZE:
+            self._put(bytes(self._buffer[:CHUNK_SIZE]))
+            del self._buffer[:CHUNK_SIZE]
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _put(self, chunk):
+        while True:
+            if self._cancelled.is_set():
+                raise _Cancelled()
+            try:
+                self._chunks.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+
+def snapshot_database(db_path, dest):
+    """Write a consistent, compacted copy of the database to ``dest``."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute('VACUUM INTO ?', (dest,))
+    finally:
+        conn.close()
+
+
+_hash_dbs = {}
+
+
+def _hash_db(runtime_dir):
+    path = os.path.join(runtime_dir, 'upload-hashes.sqlite')
+    if path not in _hash_dbs:
+        _hash_dbs[path] = LocalSQLite(path, schema=(
+            'CREATE TABLE IF NOT EXISTS hashes ('
+            ' path TEXT PRIMARY KEY, size INTEGER NOT NULL,'
+            ' mtime_ns INTEGER NOT NULL, sha256 TEXT NOT NULL)',
+        ))
+    return _hash_dbs[path]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cached_sha256(conn, path, rel, stat):
+    row = conn.execute('SELECT size, mtime_ns, sha256 FROM hashes WHERE path = ?', (rel,)).fetchone()
+    if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+        return row[2]
+    sha256 = file_sha256(path)
+    conn.execute('INSERT OR REPLACE INTO hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)',
+                 (rel, stat.st_size, stat.st_mtime_ns, sha256))
+    return sha256
+
+
+def iter_manifest(upload_folder, runtime_dir):
+    """(absolute path, relative name, stat, sha256) for every upload."""
+    conn = _hash_db(runtime_dir).conn()
+    for path, rel in iter_uploads(upload_folder):
+        try:
+            stat = os.stat(path)
+            yield path, rel, stat, _cached_sha256(conn, path, rel, stat)
+        except FileNotFoundError:
+            continue  # removed by gc-uploads meanwhile
+
+
+def iter_uploads(upload_folder):
+    """(absolute path, relative name) of every upload, one directory at a time."""
+    if not os.path.isdir(upload_folder):
+        return
+    stack = [upload_folder]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False) and not entry.name.startswith('.'):
+                    rel = os.path.relpath(entry.path, upload_folder).replace(os.sep, '/')
+                    yield entry.path, rel
+
+
+def _add_bytes(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = time.time()
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _write_archive(sink, db_path, upload_folder, runtime_dir, since):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        meta = {'format': FORMAT, 'created_at': time.time(), 'since': since}
+        snapshot = os.path.join(tmp_dir, DB_ARCNAME)
+        snapshot_database(db_path, snapshot)
+        manifest_path = os.path.join(tmp_dir, MANIFEST_ARCNAME)
+        with tarfile.open(fileobj=sink, mode='w|gz', bufsize=CHUNK_SIZE) as tar, \
+                open(manifest_path, 'w') as manifest:
+            _add_bytes(tar, META_ARCNAME, json.dumps(meta).encode())
+            tar.add(snapshot, arcname=DB_ARCNAME)
+            os.remove(snapshot)
+            for path, rel, stat, sha256 in iter_manifest(upload_folder, runtime_dir):
+                manifest.write(json.dumps([rel, stat.st_size, sha256]) + '\n')
+                if since is not None and stat.st_mtime < since:
+                    continue
+                try:
+                    tar.add(path, arcname=f'uploads/{rel}')
+                except FileNotFoundError:
+                    continue
+            manifest.close()
+            tar.add(manifest_path, arcname=MANIFEST_ARCNAME)
+        sink.flush()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def stream_archive(db_path, upload_folder, runtime_dir, since=None):
+    """Generator of ``.tar.gz`` chunks: a full backup, or with ``since`` (epoch
+    seconds) an incremental one carrying only uploads changed since then."""
+    chunks = queue.Queue(maxsize=QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    done = object()
+    errors = []
+
+    def produce():
+        try:
+            _write_archive(_QueueWriter(chunks, cancelled), db_path, upload_folder,
+                           runtime_dir, since)
+        except _Cancelled:
+            return
+        except Exception as exc:
+            errors.append(exc)
+        while not cancelled.is_set():
+            try:
+                chunks.put(done, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    producer = threading.Thread(target=produce, daemon=True, name='veau-backup')
+    producer.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            yield chunk
+        if errors:
+            # Headers are long gone: aborting leaves a truncated, invalid archive
+            raise errors[0]
+    finally:
+        cancelled.set()
+        producer.join(timeout=5)
+
+
+# ── Restore ──────────────────────────────────────────────
+
+class RestoreError(Exception):
+    pass
+
+
+def _safe_upload_name(member_name):
+    """Relative upload path of an ``uploads/...`` member, or None if unsafe."""
+    rel = os.path.normpath(member_name[len('uploads/'):])
+    if rel in ('', '.') or rel.startswith('..') or os.path.isabs(rel):
+        return None
+    return rel
+
+
+def _write_upload(upload_folder, rel, data):
+    """Write one upload atomically; returns (rel, size, sha256)."""
+    dest = os.path.join(upload_folder, rel)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = dest + '.restore-tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, dest)
+    return rel, len(data), hashlib.sha256(data).hexdigest()
+
+
+def check_database(path):
+    """Raise RestoreError unless ``PRAGMA integrity_check`` passes."""
+    conn = sqlite3.connect(path)
+    try:
+        result = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+    except sqlite3.DatabaseError as exc:
+        raise RestoreError(f'database is not readable: {exc}')
+    finally:
+        conn.close()
+    if result != ['ok']:
+        raise RestoreError(f'integrity_check failed: {"; ".join(result[:5])}')
+
+
+def swap_database(new_path, db_path):
+    """Move ``new_path`` over ``db_path`` with one rename. The old database is
+    kept as ``<db_path>.before-restore``; its WAL files are removed first so
+    they can't be replayed into the restored file.
+
+    Committed transactions still in the WAL (all of them since the last
+    checkpoint with replication's wal_autocheckpoint=0) are checkpointed into
+    the old file first. If another connection blocks that, the WAL is copied
+    to ``<db_path>.before-restore-wal``, where SQLite finds it when the kept
+    file is opened."""
+    if os.path.exists(db_path):
+        keep = db_path + '.before-restore'
+        for path in (keep, keep + '-wal', keep + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        conn = sqlite3.connect(db_path)
+        try:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        finally:
+            conn.close()
+        os.link(db_path, keep)
+        wal = db_path + '-wal'
+        if os.path.exists(wal) and os.path.getsize(wal) > 0:
+            shutil.copyfile(wal, keep + '-wal')
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    os.replace(new_path, db_path)
+
+
+def restore_archives(backup_files, db_path, upload_folder, jobs=8, echo=print):
+    """Restore a full backup plus incremental ones (oldest first).
+
+    Each archive is read once, front to back. Upload bytes are handed to a
+    pool of ``jobs`` threads that write them (atomically) while the next
+    members are decompressed; the database of the last archive is written
+    next to the live one. Nothing replaces the live database until the
+    snapshot passes ``PRAGMA integrity_check`` and every upload in the
+    final manifest is present with the listed size and sha256.
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    os.makedirs(upload_folder, exist_ok=True)
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    new_db = db_path + '.restore-tmp'
+    written = {}  # rel → (size, sha256)
+    manifest = None
+    previous = None
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending = set()
+        for i, backup_file in enumerate(backup_files):
+            last = i == len(backup_files) - 1
+            count = 0
+            with tarfile.open(backup_file, 'r|gz') as tar:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    src = tar.extractfile(member)
+                    if member.name == META_ARCNAME:
+                        meta = json.load(src)
+                        since = meta.get('since')
+                        if since is not None and (previous is None or since > previous):
+                            echo(f'  WARNING: {backup_file} is incremental but the backup before it '
+                                 'is missing; uploads from that gap may be missing')
+                        previous = meta.get('created_at')
+                    elif member.name == DB_ARCNAME:
+                        if last:
+                            with open(new_db, 'wb') as dst:
+                                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                    elif member.name == MANIFEST_ARCNAME:
+                        if last:
+                            manifest = [json.loads(line) for line in src]
+                    elif member.name.startswith('uploads/'):
+                        rel = _safe_upload_name(member.name)
+                        if rel is None:
+                            continue
+                        # Bound the bytes held by queued writes
+                        while len(pending) >= jobs * 4:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                rel_done, size, sha256 = future.result()
+                                written[rel_done] = (size, sha256)
+                        pending.add(pool.submit(_write_upload, upload_folder, rel, src.read()))
+                        count += 1
+            echo(f'  {backup_file}: {count} upload(s)')
+        for future in pending:
+            rel_done, size, sha256 = future.result()
+            written[rel_done] = (size, sha256)
+
+    if not os.path.exists(new_db):
+        raise RestoreError(f'no {DB_ARCNAME} in {backup_files[-1]}')
+    try:
+        check_database(new_db)
+        echo('  Database integrity_check: ok')
+        if manifest is not None:
+            bad = []
+            for rel, size, sha256 in manifest:
+                if rel in written:
+                    ok = written[rel] == (size, sha256)
+                else:
+                    # Restored by an earlier run, or already in place
+                    path = os.path.join(upload_folder, rel)
+                    ok = os.path.isfile(path) and os.path.getsize(path) == size \
+                        and file_sha256(path) == sha256
+                if not ok:
+                    bad.append(rel)
+            if bad:
+                raise RestoreError(f'{len(bad)} upload(s) missing or not matching the manifest, '
+                                   f'e.g. {bad[0]}')
+            echo(f'  Uploads match the manifest ({len(manifest)} file(s))')
+    except RestoreError:
+        os.remove(new_db)
+        raise
+    swap_database(new_db, db_path)
+    return len(written)
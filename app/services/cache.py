@@ -0,0 +1,44 @@
+"""Cache helpers on top of the shared Flask-Caching backend."""
+
+import time
+from ..extensions import cache
+
+LOCK_SUFFIX = ':computing'
+POLL_INTERVAL = 0.02  # seconds between checks while another process computes
+
+
+def _peek(key):
+    # The wait loop's re-reads are not new lookups: don't count them as
+    # cache misses (see metrics._CacheMetricsProxy).
+    backend = cache.cache
+    return getattr(backend, 'peek', backend.get)(key)
+
+
+def get_or_compute(key, compute, timeout, wait=2.0):
+    """Return ``cache[key]``, computing and storing it on a miss.
+
+    Concurrent misses are coalesced across threads and workers: the first
+    caller takes a short lock entry with ``cache.add`` and computes, the
+    others poll the cache for up to ``wait`` seconds before giving up and
+    computing themselves. ``compute`` must not return None.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = key + LOCK_SUFFIX
+    if not cache.add(lock_key, 1, timeout=max(1, int(wait) + 1)):
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            value = _peek(key)
+            if value is not None:
+                return value
+        return compute()
+
+    try:
+        value = compute()
+        cache.set(key, value, timeout=timeout)
+        return value
+    finally:
+        cache.delete(lock_key)
@@ -0,0 +1,143 @@
+"""Durable background jobs (transactional outbox) stored in the main database.
+
+Request code calls ``enqueue()`` before its commit; the job row is committed
+together with the post/like/... that caused it. Jobs are executed by
+one background thread per web worker (JOB_WORKER_THREAD) or by hand with
+``flask run-jobs``. Claims are leases (``locked_until``), so any number of
+runners can drain the same table and a crashed runner's job is retried.
+
+Handlers run with an app context and must be idempotent: the job row is
+deleted in the same transaction as their (final) writes, but a job whose
+runner dies halfway is run again. A failing job is retried with exponential backoff up to
+JOB_MAX_ATTEMPTS times.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from ..extensions import db
+from ..models import Job
+
+logger = logging.getLogger('veau')
+
+LEASE_SECONDS = 300  # a claimed job is retried after this if its runner died
+IDLE_SLEEP = 1.0  # seconds between polls of an empty queue
+
+HANDLERS = {}
+
+_thread_pid = None
+_thread_lock = threading.Lock()
+
+
+def job_handler(kind):
+    """Register a function as the handler for jobs of ``kind``."""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, **payload):
+    """Add a job to the current session. Runs after the caller commits."""
+    job = Job(kind=kind, payload=json.dumps(payload), run_at=datetime.utcnow())
+    db.session.add(job)
+    return job
+
+
+def _claim():
+    """Lease the oldest due job. Returns (id, kind, payload, attempts) or None."""
+    now = datetime.utcnow()
+    available = db.and_(
+        Job.run_at <= now,
+        db.or_(Job.locked_until.is_(None), Job.locked_until < now),
+    )
+    # Read first: an idle poll must not take SQLite's write lock
+    job_id = db.session.scalar(
+        db.select(Job.id).where(available).order_by(Job.run_at, Job.id).limit(1))
+    if job_id is None:
+        db.session.rollback()
+        return None
+    # Conditional update: if another runner got there first this matches nothing
+    row = db.session.execute(
+        db.update(Job).where(Job.id == job_id, available).values(
+            locked_until=now + timedelta(seconds=LEASE_SECONDS),
+            attempts=Job.attempts + 1,
+        ).returning(Job.id, Job.kind, Job.payload, Job.attempts)
+    ).first()
+    db.session.commit()
+    return row
+
+
+def run_next():
+    """Run one due job. Returns False when the queue has nothing due."""
+    claimed = _claim()
+    if claimed is None:
+        return False
+    job_id, kind, payload, attempts = claimed
+
+    try:
+        handler = HANDLERS[kind]
+        handler(**json.loads(payload))
+        db.session.execute(db.delete(Job).where(Job.id == job_id))
+        db.session.commit()
+    except Exception as exc:
+        db.session.rollback()
+        max_attempts = current_app.config['JOB_MAX_ATTEMPTS']
+        if attempts >= max_attempts:
+            run_at = None
+            logger.error('job failed permanently id=%s kind=%s attempts=%s: %r',
+                         job_id, kind, attempts, exc)
+        else:
+            run_at = datetime.utcnow() + timedelta(seconds=2 ** attempts)
+            logger.warning('job failed id=%s kind=%s attempt=%s: %r', job_id, kind, attempts, exc)
+        db.session.execute(db.update(Job).where(Job.id == job_id).values(
+            run_at=run_at, locked_until=None, last_error=repr(exc)[:1000],
+        ))
+        db.session.commit()
+    return True
+
+
+def run_pending(limit=None):
+    """Run due jobs until the queue is empty (or ``limit`` jobs ran)."""
+    done = 0
+    while (limit is None or done < limit) and run_next():
+        done += 1
+    return done
+
+
+def _worker_loop(app):
+    while True:
+        with app.app_context():
+            try:
+                ran = run_pending(limit=50)
+            except Exception:
+                logger.exception('job runner error')
+                ran = 0
+            finally:
+                db.session.remove()
+        if not ran:
+            time.sleep(IDLE_SLEEP)
+
+
+def init_app(app):
+    """Register handlers and start one runner thread per process (lazily, so
+    it survives --preload forks)."""
+    from . import achievements  # noqa: F401 (registers its job handlers)
+
+    if not app.config['JOB_WORKER_THREAD']:
+        return
+
+    @app.before_request
+    def _ensure_worker_thread():
+        global _thread_pid
+        if _thread_pid == os.getpid():
+            return
+        with _thread_lock:
+            if _thread_pid != os.getpid():
+                _thread_pid = os.getpid()
+                threading.Thread(target=_worker_loop, args=(app,), daemon=True,
+                                 name='veau-jobs').start()
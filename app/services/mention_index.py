@@ -0,0 +1,237 @@
+"""In-memory prefix index for @mention autocomplete (one per worker).
+
+Usernames, display names, group names and tag names are kept lowercased in
+one sorted list, so a prefix lookup is a bisect plus a short scan. The
+result lists for one- and two-letter prefixes, which cover most of the
+table, are cached until the next change.
+
+Changes to users, groups and tags are published on the broadcaster's system
+channel when their transaction commits. Each worker replays them (one
+indexed read of the events file) before answering, reloading just the
+changed rows. A worker that fell so far behind that the broadcaster already
+pruned events it hasn't seen rebuilds from the database instead.
+"""
+
+import os
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from sqlalchemy import event
+from .. import broadcast
+from ..extensions import db
+from ..models import Connection, Group, GroupMember, Tag, User
+
+CHANNEL = 0  # broadcaster "user id" for index changes
+SHORT_PREFIX = 2  # prefixes up to this length get cached top lists
+TOP_SIZE = 50  # entries kept per cached prefix and kind
+SCAN_LIMIT = 2000  # keys scanned for an uncached prefix
+VIEWER_TTL = 60  # seconds a viewer's connections/groups are cached
+
+KINDS = ('user', 'group', 'tag')
+
+
+class MentionIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []  # sorted (key, kind, id)
+        self._entries = {}  # (kind, id) → entry dict
+        self._top = {}  # short prefix → {kind: [entry, ...]}
+        self._viewers = {}  # user id → (expires, user ids, group ids)
+        self._last_event = 0
+        self._built = False
+        self._bulk = False  # append keys unsorted while rebuilding
+
+    # ── Maintenance ──────────────────────────────────────
+
+    def _add(self, kind, id_, keys, popularity, **data):
+        keys = {k.lower() for k in keys if k}
+        # mentions.js inserts multi-word names as "@Bier_Club": index that too
+        keys |= {re.sub(r'\s+', '_', k) for k in keys}
+        entry = dict(data, kind=kind, id=id_, popularity=popularity, keys=sorted(keys))
+        self._entries[(kind, id_)] = entry
+        for key in entry['keys']:
+            if self._bulk:
+                self._keys.append((key, kind, id_))
+            else:
+                insort(self._keys, (key, kind, id_))
+
+    def _remove(self, kind, id_):
+        entry = self._entries.pop((kind, id_), None)
+        if entry is None:
+            return
+        for key in entry['keys']:
+            i = bisect_left(self._keys, (key, kind, id_))
+            if i < len(self._keys) and self._keys[i] == (key, kind, id_):
+                del self._keys[i]
+
+    def _load(self, kind, id_=None):
+        """Add rows of one kind from the database (all, or one id)."""
+        if kind == 'user':
+            query = db.session.query(User.id, User.username, User.display_name,
+                                     User.avatar_filename)
+            counts = db.session.query(Connection.followed_id, db.func.count(Connection.id)).filter(
+                Connection.status == 'accepted')
+            if id_ is not None:
+                query = query.filter(User.id == id_)
+                counts = counts.filter(Connection.followed_id == id_)
+            popularity = dict(counts.group_by(Connection.followed_id).all())
+            for uid, username, display_name, avatar in query:
+                self._add('user', uid, [username, display_name], popularity.get(uid, 0),
+                          username=username, display_name=display_name, avatar=avatar)
+        elif kind == 'group':
+            query = db.session.query(Group.id, Group.name)
+            counts = db.session.query(GroupMember.group_id, db.func.count(GroupMember.id))
+            if id_ is not None:
+                query = query.filter(Group.id == id_)
+                counts = counts.filter(GroupMember.group_id == id_)
+            popularity = dict(counts.group_by(GroupMember.group_id).all())
+            for gid, name in query:
+                self._add('group', gid, [name], popularity.get(gid, 0),
+                          name=name, member_count=popularity.get(gid, 0))
+        else:
+            query = db.session.query(Tag.id, Tag.name, Tag.use_count)
+            if id_ is not None:
+                query = query.filter(Tag.id == id_)
+            for tid, name, use_count in query:
+                self._add('tag', tid, [name], use_count or 0, name=name)
+
+    def _rebuild(self):
+        self._last_event = broadcast.latest_id()
+        self._keys, self._entries, self._top = [], {}, {}
+        self._bulk = True
+        try:
+            for kind in KINDS:
+                self._load(kind)
+        finally:
+            self._bulk = False
+            self._keys.sort()
+        self._built = True
+
+    def sync(self):
+        """Bring the index up to date. Needs an app context."""
+        with self._lock:
+            # Events after our watermark were pruned: we may have missed some
+            if not self._built or broadcast.oldest_id() > self._last_event + 1:
+                self._rebuild()
+                return
+            # The watermark covers all channels: when only other users'
+            # events are pruned, there is nothing we could have missed
+            latest = broadcast.latest_id()
+            changes = broadcast.poll(CHANNEL, self._last_event)
+            for event_id, _, data in changes:
+                self._remove(data['kind'], data['id'])
+                self._load(data['kind'], data['id'])
+                self._last_event = event_id
+            if changes:
+                self._top = {}
+            self._last_event = max(self._last_event, latest)
+
+    # ── Lookup ───────────────────────────────────────────
+
+    def _scan(self, prefix, limit):
+        """Entries with a key starting with ``prefix``, by kind and popularity."""
+        found = {}
+        i = bisect_left(self._keys, (prefix,))
+        end = min(len(self._keys), i + limit)
+        while i < end and self._keys[i][0].startswith(prefix):
+            _, kind, id_ = self._keys[i]
+            found[(kind, id_)] = self._entries[(kind, id_)]
+            i += 1
+        by_kind = {kind: [] for kind in KINDS}
+        for entry in sorted(found.values(), key=lambda e: -e['popularity']):
+            by_kind[entry['kind']].append(entry)
+        return by_kind
+
+    def _candidates(self, prefix):
+        if len(prefix) > SHORT_PREFIX:
+            return self._scan(prefix, SCAN_LIMIT)
+        top = self._top.get(prefix)
+        if top is None:
+            top = self._top[prefix] = {
+                kind: entries[:TOP_SIZE]
+                for kind, entries in self._scan(prefix, len(self._keys)).items()}
+        return top
+
+    def _viewer(self, user_id):
+        """(connected user ids, group ids) of the viewer, cached briefly."""
+        cached = self._viewers.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1], cached[2]
+        connected = {r[0] for r in db.session.query(Connection.followed_id).filter(
+            Connection.follower_id == user_id, Connection.status == 'accepted')}
+        groups = {r[0] for r in db.session.query(GroupMember.group_id).filter(
+            GroupMember.user_id == user_id)}
+        if len(self._viewers) > 10000:
+            self._viewers.clear()
+        self._viewers[user_id] = (time.monotonic() + VIEWER_TTL, connected, groups)
+        return connected, groups
+
+    def complete(self, prefix, viewer_id, limit=8):
+        """Up to ``limit`` users, groups and tags for ``prefix``: the viewer's
+        connections/groups first, then by popularity."""
+        prefix = prefix.lower()
+        connected, groups = self._viewer(viewer_id)
+        with self._lock:
+            candidates = self._candidates(prefix)
+            own = {'user': connected, 'group': groups, 'tag': ()}
+            result = {}
+            for kind in KINDS:
+                preferred = [self._entries[(kind, i)] for i in own[kind]
+                             if (kind, i) in self._entries
+                             and any(k.startswith(prefix) for k in self._entries[(kind, i)]['keys'])]
+                preferred.sort(key=lambda e: -e['popularity'])
+                seen = {e['id'] for e in preferred}
+                rest = [e for e in candidates[kind] if e['id'] not in seen]
+                result[kind] = [e for e in preferred + rest
+                                if not (kind == 'user' and e['id'] == viewer_id)][:limit]
+            return result
+
+
+index = MentionIndex()
+_warm_pid = None
+
+
+def init_app(app):
+    """Build the index in the background when a worker serves its first
+    request, so the first autocomplete doesn't pay for it."""
+
+    def _warm():
+        with app.app_context():
+            try:
+                index.sync()
+            finally:
+                db.session.remove()
+
+    @app.before_request
+    def _warm_mention_index():
+        global _warm_pid
+        if _warm_pid != os.getpid():
+            _warm_pid = os.getpid()
+            threading.Thread(target=_warm, daemon=True, name='veau-mentions').start()
+
+
+# ── Change tracking (published on commit, see broadcast.py) ──
+
+_TRACKED = {User: ('user', {'username', 'display_name', 'avatar_filename'}),
+            Group: ('group', {'name'}),
+            Tag: ('tag', {'name'})}
+
+
+def _track(mapper, connection, target):
+    kind, _ = _TRACKED[type(target)]
+    broadcast.publish_after_commit(db.inspect(target).session, CHANNEL, 'mention_index',
+                                   {'kind': kind, 'id': target.id})
+
+
+def _track_update(mapper, connection, target):
+    _, fields = _TRACKED[type(target)]
+    state = db.inspect(target)
+    if any(state.attrs[f].history.has_changes() for f in fields):
+        _track(mapper, connection, target)
+
+
+for _model in _TRACKED:
+    event.listen(_model, 'after_insert', _track)
+    event.listen(_model, 'after_delete', _track)
+    event.listen(_model, 'after_update', _track_update)
@@ -1,21 +1,121 @@
-from ..extensions import db, cache
-from ..models import Notification
+from datetime import datetime, timedelta
+from flask import current_app
+from .. import broadcast
+from ..extensions import db
+from ..models import Comment, Like, Notification, Reaction, User
+
+# Post activity that is folded into one row per (user, post, type), with the
+# table its actors are counted from
+COALESCED_TYPES = {'like': Like, 'reaction': Reaction, 'comment': Comment}
 
 
 def notify(user_id, actor_id, notif_type, post_id=None):
-    """Create a notification. Skips if actor == user (no self-notifications)."""
+    """Create a notification. Skips if actor == user (no self-notifications).
+
+    Likes, reactions and comments on a post are coalesced into the recipient's
+    latest unread (above the read watermark) row of the same type for that post ("X and 3 others"), as long
+    as it saw activity within NOTIFICATION_COALESCE_HOURS; its actor_count is
+    the number of distinct people behind it (_count_actors). Only new rows bump
+    the recipient's unread counter. Open notification streams of the recipient
+    get the new count and a preview once the caller commits."""
     if user_id == actor_id:
         return
-    n = Notification(user_id=user_id, actor_id=actor_id, type=notif_type, post_id=post_id)
-    db.session.add(n)
-    cache.delete(f'notif_count:{user_id}')
+
+    coalesced = notif_type in COALESCED_TYPES and post_id is not None
+    if coalesced:
+        # Stamp the like/reaction/comment that triggered this before ``now``,
+        # so _count_actors sees it inside this row and not the next one.
+        db.session.flush()
+    now = datetime.utcnow()
+    if coalesced:
+        window = timedelta(hours=current_app.config.get('NOTIFICATION_COALESCE_HOURS', 24))
+        existing = _open_row(user_id, notif_type, post_id, since=now - window)
+        if existing:
+            existing.actor_id = actor_id
+            existing.actor_count = _count_actors(existing)
+            existing.created_at = now
+            _publish(user_id, actor_id, notif_type, post_id, existing.actor_count)
+            return
+
+    db.session.add(Notification(user_id=user_id, actor_id=actor_id, type=notif_type,
+                                post_id=post_id, created_at=now))
+    User.query.filter_by(id=user_id).update(
+        {User.unread_notification_count: db.func.coalesce(User.unread_notification_count, 0) + 1},
+        synchronize_session=False,
+    )
+    _publish(user_id, actor_id, notif_type, post_id, 1)
+
+
+def recount_actors(user_id, notif_type, post_id):
+    """Update the open row's actor_count after a like or reaction was
+    removed (caller deletes it first and commits)."""
+    existing = _open_row(user_id, notif_type, post_id)
+    if existing:
+        existing.actor_count = _count_actors(existing)
+
+
+def _open_row(user_id, notif_type, post_id, since=None):
+    """The recipient's latest unread row of this type for the post."""
+    query = Notification.query.filter(
+        Notification.user_id == user_id,
+        Notification.post_id == post_id,
+        Notification.type == notif_type,
+        Notification.id > db.session.query(User.last_read_notification_id).filter(
+            User.id == user_id
+        ).scalar_subquery(),
+    )
+    if since is not None:
+        query = query.filter(Notification.created_at >= since)
+    return query.order_by(Notification.id.desc()).first()
+
+
+def _count_actors(row):
+    """Distinct people (not actions) behind a coalesced row: the authors of
+    the post's likes/reactions/comments made after the previous row of this
+    type was last touched. Removed likes and reactions no longer count."""
+    source = COALESCED_TYPES[row.type]
+    previous = db.session.query(Notification.created_at).filter(
+        Notification.user_id == row.user_id,
+        Notification.post_id == row.post_id,
+        Notification.type == row.type,
+        Notification.id < row.id,
+    ).order_by(Notification.id.desc()).limit(1).scalar()
+    query = db.session.query(db.func.count(db.distinct(source.user_id))).filter(
+        source.post_id == row.post_id,
+        source.user_id != row.user_id,
+    )
+    if previous is not None:
+        query = query.filter(source.created_at > previous)
+    return max(query.scalar() or 0, 1)
+
+
+def _publish(user_id, actor_id, notif_type, post_id, actor_count):
+    actor = db.session.get(User, actor_id)
+    broadcast.publish_after_commit(db.session, user_id, 'notification', {
+        'count': get_unread_count(user_id),
+        'type': notif_type,
+        'actor': actor.display_name if actor else '',
+        'actor_count': actor_count,
+        'post_id': post_id,
+    })
 
 
 def get_unread_count(user_id):
-    """Get unread notification count (cached 60s)."""
-    key = f'notif_count:{user_id}'
-    count = cache.get(key)
-    if count is None:
-        count = Notification.query.filter_by(user_id=user_id, is_read=False).count()
-        cache.set(key, count, timeout=60)
-    return count
+    """Get unread notification count from the counter column (no COUNT query)."""
+    return db.session.query(User.unread_notification_count).filter(
+        User.id == user_id
+    ).scalar() or 0
+
+
+def mark_read(user):
+    """Move the user's read watermark to their newest notification and reset
+    the unread counter. One indexed MAX() plus (only if something changed) a
+    single-row UPDATE, regardless of how many notifications are unread.
+    Caller commits."""
+    newest_id = db.session.query(db.func.max(Notification.id)).filter(
+        Notification.user_id == user.id
+    ).scalar() or 0
+    if newest_id > (user.last_read_notification_id or 0) or user.unread_notification_count:
+        user.last_read_notification_id = max(newest_id, user.last_read_notification_id or 0)
+        user.unread_notification_count = 0
+        broadcast.publish_after_commit(db.session, user.id, 'unread', {'count': 0})
@@ -0,0 +1,171 @@
+"""Full-text search over users, groups and tags (SQLite FTS5).
+
+Each searchable table gets two external-content FTS5 indexes, kept in sync
+by triggers so every write path (ORM, bulk updates, raw SQL) is covered:
+
+* ``<table>_fts_prefix`` — word tokens with 1- and 2-character prefix
+  indexes, for the first keystrokes ("ja" → "Jan Jansen").
+* ``<table>_fts_tri`` — trigrams, for substring matches from 3 characters
+  ("ans" → "Jansen"), which is what the old ``ilike('%q%')`` offered.
+
+A query fetches a bounded set of candidate ids from the index, then ranks
+only those: exact username/name match first, then popularity (accepted
+connections, group members, tag uses), then FTS relevance.
+"""
+
+import re
+from ..extensions import db
+from ..models import Connection, Group, GroupMember, Tag, User
+
+CANDIDATES = 200  # index hits considered for ranking per query
+
+# table → searchable columns (rowid is the table's integer primary key)
+FTS_TABLES = {
+    'users': ('username', 'display_name'),
+    'groups': ('name',),
+    'locations': ('name',),  # Tag
+}
+TOKENIZERS = {
+    'prefix': "tokenize='unicode61 remove_diacritics 2', prefix='1 2'",
+    'tri': "tokenize='trigram'",
+}
+
+
+def _ddl():
+    statements = []
+    for table, columns in FTS_TABLES.items():
+        cols = ', '.join(columns)
+        new_vals = ', '.join(f'new.{c}' for c in columns)
+        old_vals = ', '.join(f'old.{c}' for c in columns)
+        for kind, options in TOKENIZERS.items():
+            fts = f'{table}_fts_{kind}'
+            statements.append(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                f"{cols}, content='{table}', content_rowid='id', {options})")
+        inserts = ' '.join(
+            f'INSERT INTO {table}_fts_{kind}(rowid, {cols}) VALUES (new.id, {new_vals});'
+            for kind in TOKENIZERS)
+        deletes = ' '.join(
+            f"INSERT INTO {table}_fts_{kind}({table}_fts_{kind}, rowid, {cols}) "
+            f"VALUES ('delete', old.id, {old_vals});"
+            for kind in TOKENIZERS)
+        statements += [
+            f'CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON "{table}" '
+            f'BEGIN {inserts} END',
+            f'CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON "{table}" '
+            f'BEGIN {deletes} END',
+            f'CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF {cols} ON "{table}" '
+            f'BEGIN {deletes} {inserts} END',
+        ]
+    return statements
+
+
+def ensure_index():
+    """Create the FTS tables and triggers if missing; build new ones from the
+    existing rows. Idempotent, runs at startup. Caller commits."""
+    existing = {name for (name,) in db.session.execute(db.text(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '%\\_fts\\_%' ESCAPE '\\'"
+    ))}
+    for statement in _ddl():
+        db.session.execute(db.text(statement))
+    for table in FTS_TABLES:
+        for kind in TOKENIZERS:
+            fts = f'{table}_fts_{kind}'
+            if fts not in existing:
+                db.session.execute(db.text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def is_fts_table(name):
+    """True for FTS tables and their shadow tables (hidden from Alembic)."""
+    return any(name.startswith(f'{table}_fts_') for table in FTS_TABLES)
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Alembic autogenerate filter: the FTS tables are managed by ensure_index()."""
+    return not (type_ == 'table' and is_fts_table(name))
+
+
+def _spaced(q):
+    """``q`` as typed in a mention: "Bier_Club" stands for "Bier Club"."""
+    return q.replace('_', ' ')
+
+
+def _match_expression(q):
+    """(fts table suffix, MATCH expression) for a user query, or None."""
+    # Underscores separate tokens, as they do in the unicode61 tokenizer
+    words = re.findall(r'[^\W_]+', q.lower())
+    if not words:
+        return None
+    if len(q) >= 3:
+        # Trigram index: the whole query as one quoted substring (either form
+        # for "bier_c": usernames keep their underscores, names have spaces)
+        phrases = dict.fromkeys((q, _spaced(q)))
+        return 'tri', ' OR '.join('"' + p.replace('"', '""') + '"' for p in phrases)
+    # Short query: word-prefix match
+    return 'prefix', ' '.join(f'"{w}"*' for w in words)
+
+
+def _candidate_ids(table, q):
+    match = _match_expression(q)
+    if match is None:
+        return []
+    kind, expression = match
+    # A one-letter prefix matches a large share of all rows; ranking them
+    # all by bm25 costs more than it's worth for the first keystroke
+    order = 'ORDER BY rank ' if len(q) > 1 else ''
+    rows = db.session.execute(db.text(
+        f'SELECT rowid FROM {table}_fts_{kind} WHERE {table}_fts_{kind} MATCH :q '
+        f'{order}LIMIT :limit'
+    ), {'q': expression, 'limit': CANDIDATES})
+    return [r[0] for r in rows]
+
+
+def _ranked(ids, popularity, limit):
+    """Order candidate ids by popularity, keeping FTS order as tie-breaker."""
+    position = {id_: i for i, id_ in enumerate(ids)}
+    return sorted(ids, key=lambda id_: (-popularity.get(id_, 0), position[id_]))[:limit]
+
+
+def search_users(q, exclude_id=None, limit=20):
+    ids = _candidate_ids('users', q)
+    exact = db.session.query(User.id).filter(User.username == q.lower()).scalar()
+    if exact is not None and exact not in ids:
+        ids.insert(0, exact)
+    ids = [i for i in ids if i != exclude_id]
+    if not ids:
+        return []
+    popularity = dict(db.session.query(
+        Connection.followed_id, db.func.count(Connection.id)
+    ).filter(
+        Connection.followed_id.in_(ids), Connection.status == 'accepted'
+    ).group_by(Connection.followed_id).all())
+    head = [exact] if exact in ids else []
+    ordered = head + [i for i in _ranked(ids, popularity, limit) if i not in head]
+    users = {u.id: u for u in User.query.filter(User.id.in_(ordered[:limit]))}
+    return [users[i] for i in ordered[:limit] if i in users]
+
+
+def search_groups(q, limit=20):
+    ids = _candidate_ids('groups', q)
+    if not ids:
+        return []
+    popularity = dict(db.session.query(
+        GroupMember.group_id, db.func.count(GroupMember.id)
+    ).filter(GroupMember.group_id.in_(ids)).group_by(GroupMember.group_id).all())
+    groups = {g.id: g for g in Group.query.filter(Group.id.in_(ids))}
+    names = {q.lower(), _spaced(q).lower()}
+    exact = [i for i in ids if groups.get(i) and groups[i].name.lower() in names]
+    ordered = exact + [i for i in _ranked(ids, popularity, limit) if i not in exact]
+    return [groups[i] for i in ordered[:limit] if i in groups]
+
+
+def search_tags(q, limit=20):
+    ids = _candidate_ids('locations', q)
+    if not ids:
+        return []
+    tags = {t.id: t for t in Tag.query.filter(Tag.id.in_(ids))}
+    popularity = {i: t.use_count or 0 for i, t in tags.items()}
+    names = {q.lower(), _spaced(q).lower()}
+    exact = [i for i in ids if i in tags and tags[i].name.lower() in names]
+    ordered = exact + [i for i in _ranked(ids, popularity, limit) if i not in exact]
+    return [tags[i] for i in ordered[:limit]]
@@ -0,0 +1,68 @@
+"""Reference counts for stored uploads.
+
+Uploads are content-addressed (see image_pool.py), so the same file can be
+the avatar of one user and the photo of several posts. Every change to an
+image column adjusts ``uploads.refcount`` in the same transaction as the
+change itself, so a file with count 0 is referenced by nothing committed.
+"""
+
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert
+from ..extensions import db
+from ..models import BeerPost, Group, Upload, User
+
+# model → column holding an upload filename
+IMAGE_COLUMNS = {User: 'avatar_filename', Group: 'avatar_filename', BeerPost: 'photo_filename'}
+
+
+def _acquire(connection, filename):
+    stmt = insert(Upload).values(filename=filename, refcount=1, created_at=datetime.utcnow())
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=[Upload.filename], set_={'refcount': Upload.refcount + 1}))
+
+
+def _release(connection, filename):
+    connection.execute(db.update(Upload).where(
+        Upload.filename == filename, Upload.refcount > 0
+    ).values(refcount=Upload.refcount - 1))
+
+
+def _after_insert(mapper, connection, target):
+    filename = getattr(target, IMAGE_COLUMNS[type(target)])
+    if filename:
+        _acquire(connection, filename)
+
+
+def _after_update(mapper, connection, target):
+    history = db.inspect(target).attrs[IMAGE_COLUMNS[type(target)]].history
+    if not history.has_changes():
+        return
+    for filename in history.deleted:
+        if filename:
+            _release(connection, filename)
+    for filename in history.added:
+        if filename:
+            _acquire(connection, filename)
+
+
+def _before_delete(mapper, connection, target):
+    column = IMAGE_COLUMNS[type(target)]
+    getattr(target, column)  # load it if expired; the row is still there
+    history = db.inspect(target).attrs[column].history
+    for filename in history.deleted or history.unchanged:
+        if filename:
+            _release(connection, filename)
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+for _model, _column in IMAGE_COLUMNS.items():
+    event.listen(_model, 'after_insert', _after_insert)
+    event.listen(_model, 'after_update', _after_update)
+    event.listen(_model, 'before_delete', _before_delete)
+    # Load the previous filename on assignment, so it can be released
+    event.listen(getattr(_model, _column), 'set', _keep_old_value,
+                 active_history=True)
@@ -0,0 +1,67 @@
+"""Per-connection SQLite settings for the app database.
+
+Most PRAGMAs (cache_size, mmap_size, busy_timeout, foreign_keys, ...) only
+last for the connection they run on, so they are applied from a SQLAlchemy
+``connect`` event to every new DBAPI connection, pooled ones included,
+instead of once at startup. Values come from the SQLITE_* config; with
+REPLICA_DIR set, ``wal_autocheckpoint`` is 0 (replication.py checkpoints).
+
+``flask bench-sqlite`` times the feed and leaderboard queries under
+different cache_size / mmap_size values.
+"""
+
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_SYNCHRONOUS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+_TEMP_STORE = ('DEFAULT', 'FILE', 'MEMORY')
+
+_pragmas = []  # [(name, value)], applied in this order
+
+
+def pragmas_from_config(config, **overrides):
+    """The PRAGMA list for ``config``; ``overrides`` replace single values."""
+    synchronous = config['SQLITE_SYNCHRONOUS'].upper()
+    temp_store = config['SQLITE_TEMP_STORE'].upper()
+    if synchronous not in _SYNCHRONOUS:
+        raise ValueError(f'SQLITE_SYNCHRONOUS must be one of {", ".join(_SYNCHRONOUS)}')
+    if temp_store not in _TEMP_STORE:
+        raise ValueError(f'SQLITE_TEMP_STORE must be one of {", ".join(_TEMP_STORE)}')
+    pragmas = {
+        'journal_mode': 'WAL',  # persistent; a no-op once the file is in WAL mode
+        'synchronous': synchronous,
+        'busy_timeout': int(config['SQLITE_BUSY_TIMEOUT_MS']),
+        'cache_size': -int(config['SQLITE_CACHE_SIZE_KB']),  # negative: KiB, not pages
+        'mmap_size': int(config['SQLITE_MMAP_SIZE_MB']) * 1024 * 1024,
+        'temp_store': temp_store,
+        'foreign_keys': 'ON' if config['SQLITE_FOREIGN_KEYS'] else 'OFF',
+        'wal_autocheckpoint': 0 if config['REPLICA_DIR'] else int(config['SQLITE_WAL_AUTOCHECKPOINT']),
+    }
+    pragmas.update(overrides)
+    return list(pragmas.items())
+
+
+def configure(pragmas):
+    """Use ``pragmas`` for connections opened from now on."""
+    _pragmas[:] = pragmas
+
+
+def apply(dbapi_connection, pragmas=None):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in _pragmas if pragmas is None else pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def _on_connect(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        apply(dbapi_connection)
+
+
+def init_app(app):
+    configure(pragmas_from_config(app.config))
+    if not event.contains(Engine, 'connect', _on_connect):
+        event.listen(Engine, 'connect', _on_connect)
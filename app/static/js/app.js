@@ -268,4 +268,119 @@ document.addEventListener('DOMContentLoaded', function() {
 
         observer.observe(sentinel);
     };
+
+    // ── Live notifications: polling by default, server-sent events if enabled ──
+    var streamUrl = document.body.dataset.notificationStream;
+    var pollUrl = document.body.dataset.notificationPoll;
+    if (streamUrl || pollUrl) {
+        var setBadge = function(count) {
+            document.querySelectorAll('[data-notification-badge]').forEach(function(badge) {
+                badge.textContent = count;
+                badge.classList.toggle('hidden', count <= 0);
+                badge.classList.toggle('flex', count > 0);
+            });
+        };
+
+        var previewText = function(data) {
+            var others = (data.actor_count || 1) - 1;
+            var who = data.actor + (others ? ' en ' + others + (others === 1 ? ' ander' : ' anderen') : '');
+            switch (data.type) {
+                case 'like': return who + (others ? ' vonden' : ' vond') + ' je bericht leuk ❤️';
+                case 'comment': return who + (others ? ' reageerden' : ' reageerde') + ' op je bericht 💬';
+                case 'reaction': return who + (others ? ' reageerden' : ' reageerde') + ' op je bericht';
+                case 'connection_request': return who + ' wil met je connecten 👋';
+                case 'connection_accepted': return who + ' heeft je verzoek geaccepteerd ✅';
+            }
+            return '';
+        };
+
+        var handleEvent = function(name, data) {
+            if (name === 'unread') {
+                setBadge(data.count);
+            } else if (name === 'notification') {
+                setBadge(data.count);
+                var text = previewText(data);
+                if (text) veauAlert(text);
+            } else if (name === 'achievement') {
+                veauAlert(data.icon + ' Prestatie ontgrendeld: ' + data.name + '!');
+            }
+        };
+
+        var start, stop;
+        if (streamUrl && window.EventSource) {
+            var source = null;
+            start = function() {
+                if (source) return;
+                source = new EventSource(streamUrl);
+                ['unread', 'notification', 'achievement'].forEach(function(name) {
+                    source.addEventListener(name, function(e) {
+                        handleEvent(name, JSON.parse(e.data));
+                    });
+                });
+            };
+            stop = function() {
+                if (source) {
+                    source.close();
+                    source = null;
+                }
+            };
+        } else if (pollUrl) {
+            var lastId = parseInt(document.body.dataset.notificationAfter, 10) || 0;
+            var timer = null;
+            var interval = (parseInt(document.body.dataset.notificationPollSeconds, 10) || 30) * 1000;
+            var poll = function() {
+                timer = null;
+                fetch(pollUrl + '?after=' + lastId, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+                    .then(function(r) { return r.ok ? r.json() : null; })
+                    .then(function(data) {
+                        if (!data) return;
+                        data.events.forEach(function(e) { handleEvent(e.event, e.data); });
+                        lastId = data.last_id;
+                        setBadge(data.count);
+                    })
+                    .catch(function() {})
+                    .then(function() {
+                        if (!document.hidden && timer === null) timer = setTimeout(poll, interval);
+                    });
+            };
+            var started = false;
+            start = function() {
+                // First poll one interval after the page load (the page has
+                // the current count); right away when a tab comes back
+                if (timer === null) timer = setTimeout(poll, started ? 0 : interval);
+                started = true;
+            };
+            stop = function() {
+                if (timer !== null) {
+                    clearTimeout(timer);
+                    timer = null;
+                }
+            };
+        }
+
+        if (start) {
+            // Nothing runs for background tabs
+            document.addEventListener('visibilitychange', function() {
+                if (document.hidden) stop(); else start();
+            });
+            if (!document.hidden) start();
+        }
+    }
+
+    // ── Photos still being processed: swap in once ready ──
+    document.querySelectorAll('img[data-upload-pending]').forEach(function(img) {
+        var url = img.getAttribute('src');
+        var tries = 0;
+        var check = function() {
+            fetch(url, { method: 'HEAD', cache: 'no-store' }).then(function(response) {
+                if (response.ok && !response.headers.get('X-Upload-Pending')) {
+                    img.src = url + (url.indexOf('?') < 0 ? '?' : '&') + 'r=' + Date.now();
+                    img.removeAttribute('data-upload-pending');
+                } else if (++tries < 30) {
+                    setTimeout(check, 1500);
+                }
+            }).catch(function() {});
+        };
+        setTimeout(check, 1500);
+    });
 });
@@ -53,11 +53,11 @@ document.addEventListener('DOMContentLoaded', function() {
 
         clearTimeout(debounceTimer);
         debounceTimer = setTimeout(function() {
-            fetch('/api/search?q=' + encodeURIComponent(raw))
+            fetch('/api/mentions/complete?q=' + encodeURIComponent(raw))
                 .then(function(r) { return r.json(); })
                 .then(function(data) { showDropdown(data, textarea); })
                 .catch(function(err) { console.error('mentions.js: fetch error', err); dismissDropdown(); });
-        }, 200);
+        }, 100);
     }
 
     function handleKeydown(e) {
@@ -33,6 +33,8 @@ self.addEventListener('activate', function(e) {
 self.addEventListener('fetch', function(e) {
   // Skip non-GET requests
   if (e.request.method !== 'GET') return;
+  // Leave live streams (notifications) to the browser
+  if ((e.request.headers.get('Accept') || '').includes('text/event-stream')) return;
 
   e.respondWith(
     fetch(e.request).then(function(response) {
@@ -3,12 +3,18 @@
 # VEAU Backup Script
 # Downloads a backup of the database + uploads from any host.
 #
+# A full backup is taken every FULL_EVERY_DAYS; the runs in between are
+# incremental: the database plus only the uploads added since the previous
+# backup. Restore a full backup together with the incremental ones after it.
+#
 # Usage:
-#   ./backup.sh
+#   ./backup.sh          # full or incremental, whichever is due
+#   ./backup.sh --full   # force a full backup
 #
 # Environment variables (set in .env or export them):
 #   BACKUP_URL    - Your app URL (e.g. https://web-production-76788.up.railway.app)
 #   BACKUP_SECRET - The secret token matching BACKUP_SECRET on the server
+#   FULL_EVERY_DAYS - Days between full backups (default: 7)
 #
 # Or create a .env file in the project root:
 #   BACKUP_URL=https://web-production-76788.up.railway.app
@@ -23,7 +29,8 @@ set -euo pipefail
 
 SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
 BACKUP_DIR="$SCRIPT_DIR/backups"
-MAX_BACKUPS=10
+MAX_BACKUPS=10  # full backups kept (with their incremental ones)
+STATE_FILE="$BACKUP_DIR/.last-backup"  # "<created_at> <full backup file>"
 
 # Load .env if it exists
 if [ -f "$SCRIPT_DIR/.env" ]; then
@@ -45,23 +52,48 @@ if [ -z "${BACKUP_SECRET:-}" ]; then
     exit 1
 fi
 
+FULL_EVERY_DAYS="${FULL_EVERY_DAYS:-7}"
+
 # Create backup directory
 mkdir -p "$BACKUP_DIR"
 
+# Full or incremental? Incremental needs the previous backup's timestamp and
+# a full backup that is recent enough
+SINCE=""
+LAST_FULL=""
+if [ "${1:-}" != "--full" ] && [ -f "$STATE_FILE" ]; then
+    read -r SINCE LAST_FULL < "$STATE_FILE" || true
+    if [ -z "$LAST_FULL" ] || [ ! -f "$BACKUP_DIR/$LAST_FULL" ] \
+        || [ -n "$(find "$BACKUP_DIR/$LAST_FULL" -mtime +"$FULL_EVERY_DAYS")" ]; then
+        SINCE=""
+    fi
+fi
+
 # Generate filename with timestamp
 TIMESTAMP=$(date +%Y-%m-%d-%H%M%S)
-FILENAME="veau-${TIMESTAMP}.tar.gz"
+if [ -n "$SINCE" ]; then
+    FILENAME="veau-${TIMESTAMP}-incr.tar.gz"
+    QUERY="&since=${SINCE}"
+else
+    FILENAME="veau-${TIMESTAMP}.tar.gz"
+    QUERY=""
+fi
 FILEPATH="$BACKUP_DIR/$FILENAME"
 
 echo "VEAU Backup"
 echo "  Source: $BACKUP_URL"
 echo "  Time:   $(date)"
+if [ -n "$SINCE" ]; then
+    echo "  Mode:   incremental (on top of $LAST_FULL)"
+else
+    echo "  Mode:   full"
+fi
 echo ""
 
 # Download backup
 echo "Downloading backup..."
 HTTP_CODE=$(curl -s -w "%{http_code}" -o "$FILEPATH" \
-    "${BACKUP_URL}/api/backup?secret=${BACKUP_SECRET}")
+    "${BACKUP_URL}/api/backup?secret=${BACKUP_SECRET}${QUERY}")
 
 if [ "$HTTP_CODE" != "200" ]; then
     echo "ERROR: Server returned HTTP $HTTP_CODE"
@@ -81,6 +113,13 @@ if ! tar -tzf "$FILEPATH" > /dev/null 2>&1; then
     exit 1
 fi
 
+# Remember where the next incremental backup starts
+CREATED_AT=$(tar -xzOf "$FILEPATH" backup.json | sed -E 's/.*"created_at": ([0-9.]+).*/\1/')
+if [ -z "$SINCE" ]; then
+    LAST_FULL="$FILENAME"
+fi
+echo "$CREATED_AT $LAST_FULL" > "$STATE_FILE"
+
 # Show summary
 SIZE=$(du -h "$FILEPATH" | cut -f1)
 FILE_COUNT=$(tar -tzf "$FILEPATH" | wc -l | tr -d ' ')
@@ -90,14 +129,22 @@ echo "  File:   $FILEPATH"
 echo "  Size:   $SIZE"
 echo "  Files:  $FILE_COUNT"
 
-# Cleanup old backups (keep last MAX_BACKUPS)
-BACKUP_COUNT=$(ls -1 "$BACKUP_DIR"/veau-*.tar.gz 2>/dev/null | wc -l | tr -d ' ')
-if [ "$BACKUP_COUNT" -gt "$MAX_BACKUPS" ]; then
-    DELETE_COUNT=$((BACKUP_COUNT - MAX_BACKUPS))
+# Cleanup old backups (keep last MAX_BACKUPS full ones and the incremental
+# backups taken after the oldest of those)
+FULL_COUNT=$(ls -1 "$BACKUP_DIR"/veau-*.tar.gz 2>/dev/null | grep -vc -- '-incr\.tar\.gz$' || true)
+if [ "$FULL_COUNT" -gt "$MAX_BACKUPS" ]; then
+    OLDEST_KEPT=$(ls -1 "$BACKUP_DIR"/veau-*.tar.gz | grep -v -- '-incr\.tar\.gz$' | sort | tail -n "$MAX_BACKUPS" | head -n 1)
     echo ""
-    echo "Cleaning up $DELETE_COUNT old backup(s) (keeping last $MAX_BACKUPS)..."
-    ls -1t "$BACKUP_DIR"/veau-*.tar.gz | tail -n "$DELETE_COUNT" | xargs rm -f
+    echo "Cleaning up backups older than $(basename "$OLDEST_KEPT")..."
+    for f in "$BACKUP_DIR"/veau-*.tar.gz; do
+        if [[ "$f" < "$OLDEST_KEPT" ]]; then
+            rm -f "$f"
+        fi
+    done
 fi
 
+# Restore chain: the full backup plus the incremental ones after it
+CHAIN=$(ls -1 "$BACKUP_DIR"/veau-*.tar.gz | sort | awk -v full="$BACKUP_DIR/$LAST_FULL" '$0 >= full' | tr '\n' ' ')
+
 echo ""
-echo "Done! To restore: flask restore $FILEPATH"
+echo "Done! To restore: flask restore $CHAIN"
@@ -18,6 +18,30 @@ class Config:
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + _db_path
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # SQLite tuning, applied to every new connection (app/sqlite_pragmas.py).
+    # Sized for 4 gunicorn workers × 2 threads: cache_size is private to each
+    # connection (a few per worker), mmap'ed pages are shared by all workers
+    # through the OS page cache. `flask bench-sqlite` compares settings.
+    # Foreign keys stay off by default: existing rows were never checked
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', '8192'))
+    SQLITE_MMAP_SIZE_MB = int(os.environ.get('SQLITE_MMAP_SIZE_MB', '256'))
+    SQLITE_TEMP_STORE = os.environ.get('SQLITE_TEMP_STORE', 'MEMORY')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+    SQLITE_FOREIGN_KEYS = os.environ.get('SQLITE_FOREIGN_KEYS', '') == '1'
+    SQLITE_WAL_AUTOCHECKPOINT = int(os.environ.get('SQLITE_WAL_AUTOCHECKPOINT', '1000'))
+    # Connections per worker: the leaderboard, group and profile pages read
+    # through a separate read-only pool (app/read_pool.py; 0 disables it),
+    # everything else and all writes through the main pool. Neither pool opens
+    # overflow connections; a thread waits up to SQLITE_POOL_TIMEOUT seconds
+    SQLITE_READ_POOL_SIZE = int(os.environ.get('SQLITE_READ_POOL_SIZE', '4'))
+    SQLITE_WRITE_POOL_SIZE = int(os.environ.get('SQLITE_WRITE_POOL_SIZE', '2'))
+    SQLITE_POOL_TIMEOUT = float(os.environ.get('SQLITE_POOL_TIMEOUT', '10'))
+
+    # Runtime state shared between gunicorn workers (profiler, metrics, ...)
+    # Must be on the same machine for all workers; defaults next to the database
+    RUNTIME_DIR = os.environ.get('RUNTIME_DIR', os.path.join(_db_dir or basedir, 'run'))
+
     # Uploads: use UPLOAD_FOLDER env var or default to app/static/uploads
     # On Railway, set UPLOAD_FOLDER=/app/data/uploads (persistent volume)
     UPLOAD_FOLDER = os.environ.get(
@@ -25,6 +49,40 @@ class Config:
         os.path.join(basedir, 'app', 'static', 'uploads')
     )
     MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB max upload
+    # Serving uploads through a fronting server instead of a Python worker:
+    # UPLOADS_ACCEL_REDIRECT=/_uploads/ for an nginx "internal" location aliased
+    # to UPLOAD_FOLDER, or USE_X_SENDFILE=1 for Apache/lighttpd
+    UPLOADS_ACCEL_REDIRECT = os.environ.get('UPLOADS_ACCEL_REDIRECT', '')
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '') == '1'
+    # Image conversion pool, per gunicorn worker: processes and max queued uploads
+    # (when full, uploads are converted inside the request)
+    IMAGE_POOL_WORKERS = int(os.environ.get('IMAGE_POOL_WORKERS', '1'))
+    IMAGE_QUEUE_MAX = int(os.environ.get('IMAGE_QUEUE_MAX', '8'))
+
+    # Notifications: likes/reactions/comments on one post within this window
+    # are merged into a single "X and N others" notification
+    NOTIFICATION_COALESCE_HOURS = 24
+    # `flask prune-notifications` deletes read notifications older than this
+    NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', '90'))
+
+    # Live notification badge and toasts. Pages poll /notifications/updates
+    # every NOTIFICATION_POLL_SECONDS while visible (one short request).
+    # SSE_ENABLED=1 opens /notifications/stream instead: real push, but every
+    # open stream holds one of the worker's gthread threads (2 per worker in
+    # the 4×2 layout) for SSE_STREAM_SECONDS, so only enable it together
+    # with more --threads. Keep SSE_MAX_STREAMS below --threads; clients that
+    # don't get a slot fall back to polling every 10 × SSE_RETRY_SECONDS
+    NOTIFICATION_POLL_SECONDS = int(os.environ.get('NOTIFICATION_POLL_SECONDS', '30'))
+    SSE_ENABLED = os.environ.get('SSE_ENABLED', '') == '1'
+    SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', '1'))
+    SSE_STREAM_SECONDS = int(os.environ.get('SSE_STREAM_SECONDS', '25'))
+    SSE_RETRY_SECONDS = int(os.environ.get('SSE_RETRY_SECONDS', '3'))
+
+    # Background jobs (achievements after posting, ...): run by one thread in
+    # every web worker. `flask run-jobs` can drain the queue by hand; it must
+    # see the same database file, so it is not a separate Procfile process
+    JOB_WORKER_THREAD = os.environ.get('JOB_WORKER_THREAD', '1') == '1'
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
 
     # Pagination
     POSTS_PER_PAGE = 20
@@ -33,6 +91,30 @@ class Config:
     # Backup: set BACKUP_SECRET env var to enable the /api/backup endpoint
     BACKUP_SECRET = os.environ.get('BACKUP_SECRET', '')
 
-    # Rate limiting
-    RATELIMIT_STORAGE_URI = 'memory://'
+    # Replication: set REPLICA_DIR (another volume or a mounted remote) and run
+    # `flask replicate` next to the web workers to ship every committed
+    # transaction there; `flask restore-replica --at` rebuilds any moment
+    # since. While it is set the app leaves WAL checkpoints to the replicator
+    REPLICA_DIR = os.environ.get('REPLICA_DIR', '')
+    REPLICA_INTERVAL = float(os.environ.get('REPLICA_INTERVAL', '1'))
+    REPLICA_CHECKPOINT_PAGES = int(os.environ.get('REPLICA_CHECKPOINT_PAGES', '1000'))
+    REPLICA_SNAPSHOT_HOURS = float(os.environ.get('REPLICA_SNAPSHOT_HOURS', '24'))
+    REPLICA_RETENTION_HOURS = float(os.environ.get('REPLICA_RETENTION_HOURS', '72'))
+
+    # Profiler: set PROFILER_SECRET env var to enable /api/profile
+    PROFILER_SECRET = os.environ.get('PROFILER_SECRET', '')
+
+    # Metrics: set METRICS_SECRET env var to enable /metrics
+    # (pass as ?secret= or "Authorization: Bearer <secret>")
+    METRICS_SECRET = os.environ.get('METRICS_SECRET', '')
+
+    # Instrumentation: per-request Server-Timing header + slow-query log
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+    SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', '1') == '1'
+
+    # Rate limiting: shared SQLite counters so limits hold across gunicorn workers
+    RATELIMIT_STORAGE_URI = os.environ.get(
+        'RATELIMIT_STORAGE_URI',
+        'sqlite:///' + os.path.join(RUNTIME_DIR, 'ratelimit.sqlite')
+    )
     RATELIMIT_DEFAULT = '200 per minute'
@@ -0,0 +1,31 @@
+"""Composite (user_id, created_at) index on notifications
+
+Revision ID: 0869e4c6d6ec
+Revises: 916a325d05e3
+Create Date: 2026-10-19 10:41:13.550872
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0869e4c6d6ec'
+down_revision = '916a325d05e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.create_index('idx_notification_user_created', ['user_id', 'created_at'], unique=False)
+        # Covered by the composite index / no longer queried
+        batch_op.drop_index('ix_notifications_user_id')
+        batch_op.drop_index('ix_notifications_is_read')
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.create_index('ix_notifications_is_read', ['is_read'], unique=False)
+        batch_op.create_index('ix_notifications_user_id', ['user_id'], unique=False)
+        batch_op.drop_index('idx_notification_user_created')
@@ -0,0 +1,39 @@
+"""Coalesced notifications and persistent unread counter
+
+Revision ID: 26bbcc90d7e0
+Revises: 4017e54db22a
+Create Date: 2026-10-19 09:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '26bbcc90d7e0'
+down_revision = '4017e54db22a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('actor_count', sa.Integer(), server_default='1', nullable=True))
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unread_notification_count', sa.Integer(), server_default='0', nullable=True))
+
+    # Backfill the counter from the existing unread rows
+    op.execute(
+        'UPDATE users SET unread_notification_count = ('
+        ' SELECT COUNT(*) FROM notifications'
+        ' WHERE notifications.user_id = users.id AND notifications.is_read = 0)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('unread_notification_count')
+
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_column('actor_count')
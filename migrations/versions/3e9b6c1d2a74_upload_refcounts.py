@@ -0,0 +1,43 @@
+"""Reference counts for content-addressed uploads
+
+Revision ID: 3e9b6c1d2a74
+Revises: b7d29f4e1a60
+Create Date: 2026-10-19 16:41:12.520337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e9b6c1d2a74'
+down_revision = 'b7d29f4e1a60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all() may already have created it on boot
+    if not sa.inspect(op.get_bind()).has_table('uploads'):
+        op.create_table('uploads',
+        sa.Column('filename', sa.String(length=255), nullable=False),
+        sa.Column('refcount', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('filename')
+        )
+
+    # Count the references to existing (flat) uploads
+    op.execute("""
+        INSERT OR REPLACE INTO uploads (filename, refcount, created_at)
+        SELECT filename, COUNT(*), CURRENT_TIMESTAMP FROM (
+            SELECT avatar_filename AS filename FROM users WHERE avatar_filename IS NOT NULL
+            UNION ALL
+            SELECT avatar_filename FROM groups WHERE avatar_filename IS NOT NULL
+            UNION ALL
+            SELECT photo_filename FROM beer_posts WHERE photo_filename IS NOT NULL
+        ) GROUP BY filename
+    """)
+
+
+def downgrade():
+    op.drop_table('uploads')
@@ -0,0 +1,42 @@
+"""Jobs table (transactional outbox for background work)
+
+Revision ID: 5c1e8a2f7d43
+Revises: 0869e4c6d6ec
+Create Date: 2026-10-19 13:02:47.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e8a2f7d43'
+down_revision = '0869e4c6d6ec'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all() may already have created it on boot
+    if sa.inspect(op.get_bind()).has_table('jobs'):
+        return
+    op.create_table('jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('run_at', sa.DateTime(), nullable=True),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.create_index('idx_job_run_at', ['run_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.drop_index('idx_job_run_at')
+
+    op.drop_table('jobs')
@@ -0,0 +1,33 @@
+"""Per-user notification read watermark
+
+Revision ID: 916a325d05e3
+Revises: 26bbcc90d7e0
+Create Date: 2026-10-19 10:04:57.902511
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '916a325d05e3'
+down_revision = '26bbcc90d7e0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_read_notification_id', sa.Integer(), server_default='0', nullable=True))
+
+    # Everything already flagged read sits below the watermark
+    op.execute(
+        'UPDATE users SET last_read_notification_id = COALESCE(('
+        ' SELECT MAX(id) FROM notifications'
+        ' WHERE notifications.user_id = users.id AND notifications.is_read = 1), 0)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('last_read_notification_id')
@@ -0,0 +1,46 @@
+"""Indexed lowercase name columns on groups and tags for @mention lookups
+
+Revision ID: b7d29f4e1a60
+Revises: 5c1e8a2f7d43
+Create Date: 2026-10-19 14:26:05.309117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d29f4e1a60'
+down_revision = '5c1e8a2f7d43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('groups', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('name_lower', sa.String(length=80), nullable=True))
+        batch_op.create_index(batch_op.f('ix_groups_name_lower'), ['name_lower'], unique=False)
+
+    with op.batch_alter_table('locations', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('name_lower', sa.String(length=100), nullable=True))
+        batch_op.create_index(batch_op.f('ix_locations_name_lower'), ['name_lower'], unique=False)
+
+    # Backfill in Python: SQLite's lower() only folds ASCII
+    conn = op.get_bind()
+    for table in ('groups', 'locations'):
+        rows = conn.execute(sa.text(f'SELECT id, name FROM "{table}"')).fetchall()
+        if rows:
+            conn.execute(
+                sa.text(f'UPDATE "{table}" SET name_lower = :name_lower WHERE id = :id'),
+                [{'id': row.id, 'name_lower': row.name.lower()} for row in rows],
+            )
+
+
+def downgrade():
+    with op.batch_alter_table('locations', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_locations_name_lower'))
+        batch_op.drop_column('name_lower')
+
+    with op.batch_alter_table('groups', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_groups_name_lower'))
+        batch_op.drop_column('name_lower')
@@ -1,5 +1,4 @@
 import os
-import shutil
 import tarfile
 import click
 from app import create_app
@@ -24,25 +23,38 @@ def change_password(username, new_password):
 
 
 @app.cli.command('restore')
-@click.argument('backup_file')
-def restore(backup_file):
-    """Restore database and uploads from a backup .tar.gz file.
-
-    Usage: flask restore backups/bierstrava-2026-02-25-120000.tar.gz
+@click.argument('backup_files', nargs=-1, required=True)
+@click.option('--jobs', type=int, default=8, show_default=True,
+              help='Threads writing uploads to disk.')
+def restore(backup_files, jobs):
+    """Restore database and uploads from a backup .tar.gz file, or from a
+    full backup followed by incremental ones (oldest first).
+
+    Usage: flask restore backups/veau-2026-02-25-120000.tar.gz [backups/veau-...-incr.tar.gz ...]
+
+    Uploads are taken from every archive; the database and the final list of
+    uploads (manifest.jsonl) from the last one. The live database is only
+    replaced, with a single rename, once the restored copy passes
+    integrity_check and the uploads match the manifest checksums. Stop the
+    app first.
     """
-    if not os.path.isfile(backup_file):
-        click.echo(f'File not found: {backup_file}')
-        return
+    import time
+    from app.extensions import db
+    from app.services import backup as backup_service
 
-    if not tarfile.is_tarfile(backup_file):
-        click.echo(f'Not a valid tar.gz file: {backup_file}')
-        return
+    for backup_file in backup_files:
+        if not os.path.isfile(backup_file):
+            click.echo(f'File not found: {backup_file}')
+            return
+        if not tarfile.is_tarfile(backup_file):
+            click.echo(f'Not a valid tar.gz file: {backup_file}')
+            return
 
     db_uri = app.config['SQLALCHEMY_DATABASE_URI']
     db_path = db_uri.replace('sqlite:///', '')
     upload_folder = app.config['UPLOAD_FOLDER']
 
-    click.echo(f'Restoring from: {backup_file}')
+    click.echo(f'Restoring from: {", ".join(backup_files)}')
     click.echo(f'  Database → {db_path}')
     click.echo(f'  Uploads  → {upload_folder}')
 
@@ -50,36 +62,20 @@ def restore(backup_file):
         click.echo('Aborted.')
         return
 
-    with tarfile.open(backup_file, 'r:gz') as tar:
-        members = tar.getnames()
-        click.echo(f'  Archive contains {len(members)} file(s)')
-
-        # Extract database
-        if 'bierstrava.db' in members:
-            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
-            with tar.extractfile('bierstrava.db') as src:
-                with open(db_path, 'wb') as dst:
-                    shutil.copyfileobj(src, dst)
-            click.echo(f'  Restored database ({os.path.getsize(db_path)} bytes)')
-        else:
-            click.echo('  WARNING: No bierstrava.db found in archive')
-
-        # Extract uploads
-        upload_files = [m for m in members if m.startswith('uploads/')]
-        if upload_files:
-            os.makedirs(upload_folder, exist_ok=True)
-            for member_name in upload_files:
-                fname = os.path.basename(member_name)
-                if not fname:
-                    continue
-                with tar.extractfile(member_name) as src:
-                    dest_path = os.path.join(upload_folder, fname)
-                    with open(dest_path, 'wb') as dst:
-                        shutil.copyfileobj(src, dst)
-            click.echo(f'  Restored {len(upload_files)} upload(s)')
-        else:
-            click.echo('  No uploads in archive')
-
+    # Close this process' own connections before the file is swapped
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+    start = time.monotonic()
+    try:
+        count = backup_service.restore_archives(
+            backup_files, db_path, upload_folder, jobs=jobs, echo=click.echo)
+    except backup_service.RestoreError as exc:
+        click.echo(f'Restore FAILED, live database left untouched: {exc}')
+        raise SystemExit(1)
+    click.echo(f'  Restored database ({os.path.getsize(db_path)} bytes) and {count} upload(s) '
+               f'in {time.monotonic() - start:.1f}s')
     click.echo('Restore complete!')
 
 